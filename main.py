@@ -5,9 +5,9 @@ Solución optimizada para producción en Render
 Versión refactorizada con soporte completo para suplementos
 """
 
-from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi import FastAPI, HTTPException, Query, Request, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from typing import List, Optional, Dict, Any
 import pandas as pd
@@ -17,12 +17,42 @@ import plotly.utils
 import json
 import os
 import logging
+import sqlite3
+import asyncio
+import secrets
+import threading
+import weakref
+import time
+import hashlib
+import heapq
+import ipaddress
+import itertools
+import math
+import gzip
+import re
+import unicodedata
+from datetime import datetime, timezone
+from collections import OrderedDict, Counter
+from urllib.parse import urlencode
 import numpy as np
 from pathlib import Path
 import uvicorn
 from contextlib import asynccontextmanager
 from pandas.api.types import is_datetime64_any_dtype, is_datetime64tz_dtype
 from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+
+try:
+    import fcntl
+except ImportError:  # Windows: no se puede saber si el proceso dueño de una tabla sigue vivo
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli los assets se precomprimen solo con gzip
+    brotli = None
 
 # ==============================================
 # CONFIGURACIÓN Y LOGGING
@@ -34,6 +64,55 @@ logger = logging.getLogger(__name__)
 # Cache global para datos
 data_cache = {}
 
+# Motor de consultas: "pandas" (en memoria, por defecto) o "sqlite" (archivo local con índices)
+DATA_BACKEND = os.environ.get("DATA_BACKEND", "pandas").strip().lower()
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "portal_ilar.db")
+
+# Número máximo de resultados de API (stats, charts, páginas, facetas) en memoria
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "512"))
+# Tope en bytes de los cuerpos serializados y comprimidos que guarda esa cache
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Ingesta incremental: token requerido por la API y carpeta opcional de deltas en JSON
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN", "")
+INGEST_DROP_DIR = os.environ.get("INGEST_DROP_DIR", "")
+INGEST_POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", "5"))
+
+# Control de admisión: concurrencia global, concurrencia de rutas pesadas, cola y límite por cliente
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "1") not in ("0", "false", "no")
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "16"))
+ADMISSION_HEAVY_CONCURRENCY = int(os.environ.get("ADMISSION_HEAVY_CONCURRENCY", "4"))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Máximo por cliente (en curso + en cola); 0 lo desactiva
+ADMISSION_PER_CLIENT = int(os.environ.get("ADMISSION_PER_CLIENT", "8"))
+# Cada cuánto se revisa si un cliente en cola cerró la conexión
+ADMISSION_DISCONNECT_POLL = float(os.environ.get("ADMISSION_DISCONNECT_POLL", "0.5"))
+# Proxies de confianza (IPs o redes CIDR separadas por comas; "*" = el par directo, sea cual sea).
+# Solo si la conexión viene de uno de ellos se usa X-Forwarded-For para identificar al cliente
+TRUSTED_PROXIES = [p.strip() for p in os.environ.get("TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+# Historial de versiones de datos: entradas retenidas y claves listadas por entrada
+CHANGELOG_SIZE = int(os.environ.get("CHANGELOG_SIZE", "200"))
+CHANGELOG_MAX_KEYS = int(os.environ.get("CHANGELOG_MAX_KEYS", "500"))
+
+# Respuestas de API precomprimidas: por debajo de este tamaño no se comprime
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+
+# Assets estáticos: minificación y huella de contenido al arrancar
+ASSETS_MINIFY = os.environ.get("ASSETS_MINIFY", "1") not in ("0", "false", "no")
+
+# Registro de consultas (JSONL) y precalentamiento de cache al arrancar
+QUERY_LOG_PATH = os.environ.get("QUERY_LOG_PATH")
+QUERY_LOG_SAMPLE = float(os.environ.get("QUERY_LOG_SAMPLE", "1"))
+QUERY_LOG_FLUSH_SECONDS = float(os.environ.get("QUERY_LOG_FLUSH_SECONDS", "5"))
+WARMUP_QUERIES = int(os.environ.get("WARMUP_QUERIES", "50"))
+WARMUP_CONCURRENCY = int(os.environ.get("WARMUP_CONCURRENCY", "4"))
+
+# Canal de eventos (SSE) con los cambios de versión de datos
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "25"))
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", "1000"))
+
 # ==============================================
 # FUNCIONES DE CARGA DE DATOS
 # ==============================================
@@ -154,8 +233,7 @@ def cargar_datos_suplementos():
         
         df_referencias = pd.concat([df_ref_vitaminas, df_ref_minerales], ignore_index=True)
         
-        # Limpiar valores 'nan' en las referencias
-        df_principal['referencias'] = df_principal['referencias'].replace('nan', pd.NA)
+        df_principal = normalizar_suplementos(df_principal)
         
         return df_principal, df_referencias
     except FileNotFoundError as e:
@@ -198,6 +276,93 @@ def create_sample_references_data():
     
     return pd.DataFrame(data)
 
+# Dosis en Strength: "400 mg", "0.5 g", "20 mg/ml", "5 mg / 5 ml", "400mg tablet", "1%"
+# Tras la dosis solo se admite una forma farmacéutica: "12.5mg + 5mg" o "1 mg per ml" no se adivinan
+PATRON_DOSIS = (
+    r'^\s*(?P<cantidad>\d+(?:\.\d+)?)\s*(?P<unidad>mcg|µg|μg|ug|mg|kg|g|ml|l|iu|ui|%)(?![a-z])'
+    r'(?:\s*/\s*(?P<por_cantidad>\d+(?:\.\d+)?)?\s*(?P<por_unidad>ml|l|mg|kg|g|dose|dosis|tablet|tab|capsule|cap)(?![a-z]))?'
+    r'(?:\s+(?:tablet|tab|capsule|cap|comprimido|cápsula)s?)?\s*$'
+)
+# Unidad del texto -> (unidad normalizada, factor)
+UNIDADES_DOSIS = {
+    # µ (U+00B5, micro) y μ (U+03BC, mu griega) se escriben igual; NFKC lleva la primera a la segunda
+    'mcg': ('mg', 0.001), 'µg': ('mg', 0.001), 'μg': ('mg', 0.001), 'ug': ('mg', 0.001), 'mg': ('mg', 1.0),
+    'g': ('mg', 1000.0), 'kg': ('mg', 1e6), 'ml': ('ml', 1.0), 'l': ('ml', 1000.0),
+    'iu': ('IU', 1.0), 'ui': ('IU', 1.0), '%': ('%', 1.0),
+}
+# Denominador de una concentración; las formas farmacéuticas (por comprimido) son dosis absolutas
+UNIDADES_POR_DOSIS = {
+    'ml': ('ml', 1.0), 'l': ('ml', 1000.0), 'mg': ('g', 0.001), 'g': ('g', 1.0), 'kg': ('g', 1000.0),
+    'dose': ('dose', 1.0), 'dosis': ('dose', 1.0),
+    'tablet': (None, 1.0), 'tab': (None, 1.0), 'capsule': (None, 1.0), 'cap': (None, 1.0),
+}
+COLUMNAS_DOSIS = ['dose_amount', 'dose_unit', 'dose_per_unit']
+# Etiquetas posibles de dose_unit: categoría fija, así los deltas concatenan sin volver a object
+TIPO_UNIDAD_DOSIS = pd.CategoricalDtype(sorted(
+    {u for u, _ in UNIDADES_DOSIS.values()}
+    | {f"{u}/{p}" for u, _ in UNIDADES_DOSIS.values() for p, _ in UNIDADES_POR_DOSIS.values() if p}
+))
+# Separador de miles ("1,000 mg"); cualquier otra coma entre dígitos es ambigua ("1,5 mg")
+PATRON_MILES = r'(?<![\d,])(\d{1,3}(?:,\d{3})+)(?![\d,])'
+
+def parsear_dosis(strength: pd.Series) -> pd.DataFrame:
+    """Cantidad normalizada, unidad y unidad por (para concentraciones) a partir de Strength.
+
+    Se parsea una vez cada valor distinto y se reparte por código de factorize. Las
+    cantidades quedan en mg, ml, IU o %; las concentraciones, por una unidad del
+    denominador ("5 mg / 5 ml" -> 1 mg/ml). Lo que no se reconoce, o tiene una coma que no es
+    de miles, queda nulo.
+    """
+    codigos, unicos = pd.factorize(strength)
+    texto = pd.Series(unicos, dtype=object).astype(str).map(lambda v: unicodedata.normalize('NFKC', v)).str.lower()
+    texto = texto.str.replace(PATRON_MILES, lambda m: m.group(1).replace(',', ''), regex=True)
+    partes = texto.str.extract(PATRON_DOSIS)
+    partes[texto.str.contains(r'\d,\d', regex=True).to_numpy()] = np.nan
+
+    unidad = partes['unidad'].map(lambda u: UNIDADES_DOSIS.get(u, (None, np.nan))[0])
+    factor = partes['unidad'].map(lambda u: UNIDADES_DOSIS.get(u, (None, np.nan))[1]).astype(float)
+    por_unidad = partes['por_unidad'].map(lambda u: UNIDADES_POR_DOSIS.get(u, (None, 1.0))[0])
+    por_factor = partes['por_unidad'].map(lambda u: UNIDADES_POR_DOSIS.get(u, (None, 1.0))[1]).astype(float)
+    por_cantidad = pd.to_numeric(partes['por_cantidad'], errors='coerce').fillna(1.0)
+
+    cantidad = pd.to_numeric(partes['cantidad'], errors='coerce') * factor / (por_cantidad * por_factor)
+    etiqueta = unidad.where(por_unidad.isna(), unidad + '/' + por_unidad)
+
+    tomar = lambda valores: pd.Series(valores.to_numpy()[codigos], index=strength.index).where(codigos >= 0)
+    return pd.DataFrame({
+        'dose_amount': tomar(cantidad.round(6)).astype(float),
+        'dose_unit': tomar(etiqueta).astype(TIPO_UNIDAD_DOSIS),
+        'dose_per_unit': tomar(por_unidad),
+    })
+
+def normalizar_moleculas(df_moleculas: pd.DataFrame) -> pd.DataFrame:
+    """Normalizar texto y año de switch (carga inicial e ingesta incremental)"""
+    # Normalizar columnas de texto
+    for col in ['Molecule', 'Country', 'RX-OTC - Molecule', 'RX-OTC - Product', 'Strength']:
+        if col in df_moleculas.columns:
+            df_moleculas[col] = df_moleculas[col].astype(str).str.strip()
+
+    # Coerción segura del año
+    if 'Switch Year' in df_moleculas.columns:
+        df_moleculas['Switch Year'] = (
+            df_moleculas['Switch Year']
+            .replace({'-': None, '—': None, '': None})
+        )
+        df_moleculas['Switch Year'] = pd.to_numeric(df_moleculas['Switch Year'], errors='coerce')
+
+    # Índice de dosis derivado de Strength (nunca se parsea por petición)
+    if 'Strength' in df_moleculas.columns:
+        df_moleculas[COLUMNAS_DOSIS] = parsear_dosis(df_moleculas['Strength'])
+
+    return df_moleculas
+
+def normalizar_suplementos(df_principal: pd.DataFrame) -> pd.DataFrame:
+    """Normalizar los registros principales de suplementos (carga inicial e ingesta incremental)"""
+    # Limpiar valores 'nan' en las referencias
+    if 'referencias' in df_principal.columns:
+        df_principal['referencias'] = df_principal['referencias'].replace('nan', pd.NA)
+    return df_principal
+
 async def load_moleculas_data():
     """Cargar datos de moléculas"""
     try:
@@ -217,18 +382,7 @@ async def load_moleculas_data():
         df_moleculas = df_moleculas.drop_duplicates()
         df_moleculas = df_moleculas.drop_duplicates(subset=key_columns, keep='first')
         
-        # Normalizar columnas de texto
-        for col in ['Molecule', 'Country', 'RX-OTC - Molecule', 'RX-OTC - Product', 'Strength']:
-            if col in df_moleculas.columns:
-                df_moleculas[col] = df_moleculas[col].astype(str).str.strip()
-
-        # Coerción segura del año
-        if 'Switch Year' in df_moleculas.columns:
-            df_moleculas['Switch Year'] = (
-                df_moleculas['Switch Year']
-                .replace({'-': None, '—': None, '': None})
-            )
-            df_moleculas['Switch Year'] = pd.to_numeric(df_moleculas['Switch Year'], errors='coerce')
+        df_moleculas = normalizar_moleculas(df_moleculas)
 
         data_cache['moleculas'] = df_moleculas
         logger.info(f"✅ Moléculas cargadas: {len(df_moleculas)} registros")
@@ -269,7 +423,11 @@ async def load_supplements_data():
 
 async def load_data_on_startup():
     """Cargar todos los datos al iniciar la aplicación"""
+    global regulatory_data
     logger.info("🔄 Cargando datos en memoria...")
+
+    # Releer el marco regulatorio (también en /api/reload-data)
+    regulatory_data = load_regulatory_data()
     
     # Cargar datos de moléculas
     await load_moleculas_data()
@@ -277,6 +435,15 @@ async def load_data_on_startup():
     # Cargar datos de suplementos
     await load_supplements_data()
 
+    # Construir motores de consulta sobre los datos cargados
+    await run_in_threadpool(construir_motores)
+
+    # Perfiles por país (fuera del event loop)
+    data_cache['perfiles_pais'] = await run_in_threadpool(construir_perfiles_pais)
+
+    # Registrar la nueva versión e invalidar solo lo que cambió
+    registrar_snapshot("startup" if 'snapshot' not in data_cache else "reload")
+
 # ==============================================
 # CONFIGURACIÓN DE LA APLICACIÓN
 # ==============================================
@@ -285,9 +452,34 @@ async def load_data_on_startup():
 async def lifespan(app: FastAPI):
     """Gestión del ciclo de vida de la aplicación"""
     # Startup
+    construir_assets()
+    if ADMISSION_CONTROL and ADMISSION_PER_CLIENT > 0 and not TRUSTED_PROXIES:
+        logger.warning(
+            "⚠️ ADMISSION_PER_CLIENT se aplica por IP directa y TRUSTED_PROXIES está vacío: "
+            "detrás de un proxy todos los clientes comparten un mismo límite"
+        )
     await load_data_on_startup()
+    # Plotly arma la plantilla por defecto de forma perezosa la primera vez que se usa y eso
+    # falla ("Invalid value") si dos gráficos se generan a la vez en el threadpool: armarla aquí
+    px.bar(x=[0], y=[0])
+    px.line(x=[0], y=[0])
+    px.pie(names=['-'], values=[1])
+    # Precalentar antes de aceptar conexiones: /health no responde hasta terminar
+    if QUERY_LOG_PATH and WARMUP_QUERIES > 0:
+        await precalentar_cache(QUERY_LOG_PATH, WARMUP_QUERIES)
+    vigilancia = None
+    if INGEST_DROP_DIR:
+        carpeta = Path(INGEST_DROP_DIR)
+        carpeta.mkdir(parents=True, exist_ok=True)
+        vigilancia = asyncio.create_task(vigilar_carpeta_ingesta(carpeta))
+    volcado = asyncio.create_task(registro_consultas.volcar_periodicamente()) if registro_consultas else None
     yield
     # Shutdown
+    if vigilancia:
+        vigilancia.cancel()
+    if volcado:
+        volcado.cancel()
+        await registro_consultas.volcar()
     logger.info("🛑 Cerrando aplicación...")
 
 # Crear aplicación FastAPI
@@ -298,9 +490,282 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# ==============================================
+# ASSETS ESTÁTICOS
+# ==============================================
+
+# Tras estas palabras una '/' abre una expresión regular, no es una división
+# Tras estos signos una '/' abre una regex; '++' y '--' cierran una expresión y no están
+SIGNOS_ANTES_DE_REGEX = set('(,=:[!&|?{};+-*%<>~^')
+PALABRAS_ANTES_DE_REGEX = {
+    'return', 'typeof', 'case', 'in', 'of', 'instanceof', 'new', 'delete', 'void',
+    'throw', 'else', 'do', 'yield', 'await'
+}
+
+def _palabra_previa(codigo: str, i: int) -> str:
+    """Identificador que termina justo antes de la posición i (ignorando espacios); '' si es una propiedad"""
+    j = i
+    while j > 0 and codigo[j - 1].isspace():
+        j -= 1
+    fin = j
+    while j > 0 and (codigo[j - 1].isalnum() or codigo[j - 1] in '_$'):
+        j -= 1
+    k = j
+    while k > 0 and codigo[k - 1].isspace():
+        k -= 1
+    # obj.return / 2 es una división
+    return '' if k > 0 and codigo[k - 1] == '.' else codigo[j:fin]
+
+def minificar_js(codigo: str) -> str:
+    """Quitar comentarios, sangría y líneas vacías sin tocar strings, plantillas ni regex.
+
+    Se conservan los saltos de línea para no depender de la inserción automática de ';'.
+    """
+    segmentos = []  # (texto, es_codigo)
+    pila: List[Any] = []  # '`' = texto de plantilla; int = llaves abiertas dentro de ${...}
+    ultimo = ''
+    i, n = 0, len(codigo)
+    inicio_codigo = 0
+
+    def cerrar_codigo(hasta):
+        if hasta > inicio_codigo:
+            segmentos.append((codigo[inicio_codigo:hasta], True))
+
+    while i < n:
+        c = codigo[i]
+        if pila and pila[-1] == '`':
+            # Texto literal de una plantilla: se copia tal cual
+            j = i
+            while j < n and codigo[j] != '`' and not codigo.startswith('${', j):
+                j += 2 if codigo[j] == '\\' else 1
+            segmentos.append((codigo[i:j], False))
+            if codigo.startswith('${', j):
+                segmentos.append(('${', False))
+                pila.append(0)
+                i = j + 2
+                ultimo = '{'
+            else:
+                segmentos.append(('`', False))
+                pila.pop()
+                i = j + 1
+                ultimo = '`'
+            inicio_codigo = i
+            continue
+
+        if c in '\'"' or c == '`' or codigo.startswith('//', i) or codigo.startswith('/*', i) or (
+            c == '/' and (not ultimo or ultimo in SIGNOS_ANTES_DE_REGEX
+                          or _palabra_previa(codigo, i) in PALABRAS_ANTES_DE_REGEX)
+        ):
+            cerrar_codigo(i)
+            if c in '\'"':
+                j = i + 1
+                while j < n and codigo[j] != c and codigo[j] != '\n':
+                    j += 2 if codigo[j] == '\\' else 1
+                segmentos.append((codigo[i:j + 1], False))
+                i, ultimo = j + 1, c
+            elif c == '`':
+                segmentos.append(('`', False))
+                pila.append('`')
+                i = i + 1
+            elif codigo.startswith('//', i):
+                j = codigo.find('\n', i)
+                i = n if j < 0 else j
+            elif codigo.startswith('/*', i):
+                j = codigo.find('*/', i + 2)
+                i = n if j < 0 else j + 2
+                segmentos.append((' ', True))
+            else:
+                # Literal de expresión regular
+                j, en_clase = i + 1, False
+                while j < n and codigo[j] != '\n':
+                    d = codigo[j]
+                    if d == '\\':
+                        j += 2
+                        continue
+                    if d == '[':
+                        en_clase = True
+                    elif d == ']':
+                        en_clase = False
+                    elif d == '/' and not en_clase:
+                        break
+                    j += 1
+                segmentos.append((codigo[i:j + 1], False))
+                i, ultimo = j + 1, '/'
+            inicio_codigo = i
+            continue
+
+        if c in '+-' and codigo.startswith(c * 2, i):
+            # i++ / 2: la '/' que sigue es una división
+            ultimo = c * 2
+            i += 2
+            continue
+        if c == '{' and pila:
+            pila[-1] += 1
+        elif c == '}' and pila:
+            if pila[-1] == 0:
+                # Fin de ${...}: se vuelve al texto de la plantilla
+                cerrar_codigo(i)
+                segmentos.append(('}', False))
+                pila.pop()
+                i += 1
+                inicio_codigo = i
+                continue
+            pila[-1] -= 1
+        if not c.isspace():
+            ultimo = c
+        i += 1
+    cerrar_codigo(n)
+
+    salida = []
+    for texto, es_codigo in segmentos:
+        if es_codigo:
+            texto = re.sub(r'[ \t]*\n\s*', '\n', texto)
+            texto = re.sub(r'[ \t]+', ' ', texto)
+        salida.append(texto)
+    return ''.join(salida).strip() + '\n'
+
+# Strings, selectores de atributo y comentarios de CSS: no se compactan por dentro
+PATRON_LITERAL_CSS = re.compile(
+    r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|\[(?:"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[^\]"\'])*\]|/\*.*?\*/',
+    re.S
+)
+
+def minificar_css(codigo: str) -> str:
+    salida, inicio = [], 0
+
+    def compactar(texto: str) -> str:
+        texto = re.sub(r'\s+', ' ', texto)
+        texto = re.sub(r'\s*([{};,>])\s*', r'\1', texto)
+        return texto.replace(';}', '}')
+
+    pendiente = ''  # código entre literales; los comentarios se descartan sin cortarlo
+    for literal in PATRON_LITERAL_CSS.finditer(codigo):
+        pendiente += codigo[inicio:literal.start()]
+        inicio = literal.end()
+        if literal.group().startswith('/*'):
+            continue
+        salida.append(compactar(pendiente))
+        salida.append(literal.group())
+        pendiente = ''
+    salida.append(compactar(pendiente + codigo[inicio:]))
+    return ''.join(salida).strip() + '\n'
+
+MINIFICADORES = {'.js': minificar_js, '.css': minificar_css}
+TIPOS_ASSET = {'.js': 'text/javascript', '.css': 'text/css', '.html': 'text/html'}
+
+class RecursoCompilado:
+    """Contenido servido desde memoria con sus variantes precomprimidas"""
+
+    def __init__(self, contenido: bytes, media_type: str, comprimir: bool = True, niveles: tuple = (9, 11)):
+        self.contenido = contenido
+        self.media_type = media_type
+        self.huella = hashlib.blake2b(contenido, digest_size=8).hexdigest()
+        self.etag = f'"{self.huella}"'
+        self.variantes = {}
+        if comprimir:
+            nivel_gzip, calidad_br = niveles
+            self.variantes['gzip'] = gzip.compress(contenido, compresslevel=nivel_gzip, mtime=0)
+            if brotli is not None:
+                self.variantes['br'] = brotli.compress(contenido, quality=calidad_br)
+
+def codificaciones_aceptadas(accept_encoding: str) -> set:
+    """Codificaciones de Accept-Encoding sin q=0"""
+    aceptadas = set()
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        if nombre and not re.search(r'q\s*=\s*0(\.0*)?\s*$', parametros):
+            aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+def respuesta_recurso(recurso: RecursoCompilado, headers: Headers, cache_control: str) -> Response:
+    encabezados = {"ETag": recurso.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if headers.get("if-none-match") == recurso.etag:
+        return Response(status_code=304, headers=encabezados)
+    aceptadas = codificaciones_aceptadas(headers.get("accept-encoding", ""))
+    for codificacion in ('br', 'gzip'):
+        variante = recurso.variantes.get(codificacion)
+        # Precomprimir pequeños archivos puede dar más bytes que el original
+        if variante is not None and codificacion in aceptadas and len(variante) < len(recurso.contenido):
+            encabezados["Content-Encoding"] = codificacion
+            return Response(content=variante, media_type=recurso.media_type, headers=encabezados)
+    return Response(content=recurso.contenido, media_type=recurso.media_type, headers=encabezados)
+
+# Nombre original -> nombre con huella (p. ej. config.js -> config.1a2b3c4d5e6f7a8b.js)
+manifiesto_assets: Dict[str, str] = {}
+assets_compilados: Dict[str, RecursoCompilado] = {}
+paginas_html: Dict[str, RecursoCompilado] = {}
+
+PAGINAS = {
+    'login': 'login.html',
+    'dashboard': 'dashboard.html',
+    'moleculas': 'dashboard_moleculas.html',
+    'suplementos': 'dashboard_suplementos.html',
+}
+
+def reescribir_referencias(html: str) -> str:
+    """Apuntar las referencias a /static/ a la versión con huella"""
+    def reemplazar(m):
+        nombre = manifiesto_assets.get(m.group(2))
+        return f'{m.group(1)}/static/{nombre}{m.group(1)}' if nombre else m.group(0)
+    return re.sub(r'(["\'])/?static/([\w./-]+)\1', reemplazar, html)
+
+def construir_assets():
+    """Minificar y firmar los assets y renderizar una vez las páginas (no tienen datos por petición)"""
+    manifiesto, compilados = {}, {}
+    for ruta in sorted(Path("static").rglob("*")):
+        sufijo = ruta.suffix.lower()
+        if not ruta.is_file() or sufijo not in TIPOS_ASSET:
+            continue
+        texto = ruta.read_text(encoding="utf-8")
+        if ASSETS_MINIFY and sufijo in MINIFICADORES:
+            texto = MINIFICADORES[sufijo](texto)
+        recurso = RecursoCompilado(texto.encode("utf-8"), TIPOS_ASSET[sufijo])
+        original = ruta.relative_to("static").as_posix()
+        firmado = f"{original[:-len(sufijo)]}.{recurso.huella}{sufijo}"
+        manifiesto[original] = firmado
+        compilados[firmado] = recurso
+    manifiesto_assets.clear()
+    manifiesto_assets.update(manifiesto)
+    assets_compilados.clear()
+    assets_compilados.update(compilados)
+
+    paginas = {
+        clave: templates.get_template(plantilla).render({"request": None})
+        for clave, plantilla in PAGINAS.items()
+    }
+    # La página de inicio es loading_temp.html si existe, si no el login
+    if os.path.exists('loading_temp.html'):
+        with open('loading_temp.html', 'r', encoding='utf-8') as f:
+            paginas['inicio'] = f.read()
+    else:
+        paginas['inicio'] = paginas['login']
+    paginas_html.clear()
+    paginas_html.update({
+        clave: RecursoCompilado(reescribir_referencias(html).encode("utf-8"), TIPOS_ASSET['.html'])
+        for clave, html in paginas.items()
+    })
+
+    total = sum(len(r.contenido) for r in compilados.values())
+    logger.info(f"📦 Assets compilados: {len(compilados)} archivos, {total / 1024:.1f} KB, {len(paginas_html)} páginas")
+
+def respuesta_pagina(clave: str, request: Request) -> Response:
+    if not paginas_html:
+        construir_assets()
+    # El HTML se revalida siempre: es lo que apunta a los assets con huella
+    return respuesta_recurso(paginas_html[clave], request.headers, "no-cache")
+
+class StaticFilesConHuella(StaticFiles):
+    """Sirve los assets con huella desde memoria (inmutables) y el resto desde disco"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        recurso = assets_compilados.get(path)
+        if recurso is not None:
+            return respuesta_recurso(recurso, Headers(scope=scope), "public, max-age=31536000, immutable")
+        return await super().get_response(path, scope)
+
 # Configurar templates y archivos estáticos
 templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", StaticFilesConHuella(directory="static"), name="static")
 
 # ==============================================
 # RUTAS PRINCIPALES
@@ -309,32 +774,22 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """Página de inicio"""
-    if os.path.exists('loading_temp.html'):
-        with open('loading_temp.html', 'r', encoding='utf-8') as f:
-            content = f.read()
-        return HTMLResponse(content=content)
-    else:
-        return templates.TemplateResponse("login.html", {"request": request})
+    return respuesta_pagina('inicio', request)
 
 @app.get("/loading", response_class=HTMLResponse)
 async def loading_page(request: Request):
     """Página de carga standalone"""
-    if os.path.exists('loading_temp.html'):
-        with open('loading_temp.html', 'r', encoding='utf-8') as f:
-            content = f.read()
-        return HTMLResponse(content=content)
-    else:
-        return templates.TemplateResponse("login.html", {"request": request})
+    return respuesta_pagina('inicio', request)
 
 @app.get("/login.html", response_class=HTMLResponse)
 async def login_page(request: Request):
     """Página de login"""
-    return templates.TemplateResponse("login.html", {"request": request})
+    return respuesta_pagina('login', request)
 
 @app.get("/dashboard.html", response_class=HTMLResponse)
 async def dashboard_page(request: Request):
     """Página principal del portal"""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return respuesta_pagina('dashboard', request)
 
 # ==============================================
 # DASHBOARDS INTEGRADOS
@@ -343,12 +798,12 @@ async def dashboard_page(request: Request):
 @app.get("/analytics/molecular-data", response_class=HTMLResponse)
 async def dashboard_moleculas(request: Request):
     """Dashboard de moléculas"""
-    return templates.TemplateResponse("dashboard_moleculas.html", {"request": request})
+    return respuesta_pagina('moleculas', request)
 
 @app.get("/analytics/supplement-regulations", response_class=HTMLResponse)
 async def dashboard_suplementos(request: Request):
     """Dashboard de suplementos"""
-    return templates.TemplateResponse("dashboard_suplementos.html", {"request": request})
+    return respuesta_pagina('suplementos', request)
 
 # ==============================================
 # UTILIDADES PARA APIS
@@ -369,307 +824,1764 @@ def make_json_safe(df: pd.DataFrame) -> pd.DataFrame:
     
     return df_safe
 
+def resolver_campos(fields: Optional[List[str]], columnas: List[str]) -> Optional[List[str]]:
+    """Columnas pedidas con fields= (repetido o separado por comas), en el orden pedido; None = todas"""
+    if not fields:
+        return None
+    pedidas = list(dict.fromkeys(c.strip() for valor in fields for c in valor.split(',') if c.strip()))
+    desconocidas = [c for c in pedidas if c not in columnas]
+    if desconocidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos desconocidos: {', '.join(desconocidas)}. Disponibles: {', '.join(columnas)}"
+        )
+    return pedidas or None
+
+def codificar_diccionario(df: pd.DataFrame) -> Dict[str, Any]:
+    """Formato columnar: las columnas de texto van como tabla de valores + códigos enteros.
+
+    Los valores repetidos (país, RX-OTC, tipo...) se envían una sola vez; los faltantes
+    son código null. Las columnas numéricas y booleanas van como arreglos planos.
+    """
+    diccionarios, datos = {}, {}
+    for col in df.columns:
+        serie = df[col]
+        if is_datetime64_any_dtype(serie):
+            serie = serie.dt.strftime("%Y-%m-%d")
+        if pd.api.types.is_bool_dtype(serie):
+            datos[col] = serie.tolist()
+        elif pd.api.types.is_numeric_dtype(serie):
+            valores = serie.astype(float)
+            datos[col] = serie.astype(object).where(np.isfinite(valores), None).tolist()
+        else:
+            codigos, valores = pd.factorize(serie)
+            codigos = codigos.astype(object)
+            codigos[codigos == -1] = None
+            diccionarios[col] = jsonable_encoder(valores.tolist())
+            datos[col] = codigos.tolist()
+    return {"columns": list(df.columns), "dictionaries": diccionarios, "data": datos}
+
+def serializar_pagina(df: pd.DataFrame, total: int, limit: int, offset: int, codificacion: str) -> Dict[str, Any]:
+    """Página de datos en filas (por defecto) o codificada por diccionario"""
+    paginacion = {
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "has_next": offset + limit < total
+    }
+    if codificacion == "dictionary":
+        return {"encoding": "dictionary", **codificar_diccionario(df), "pagination": paginacion}
+    # Hacer JSON-safe
+    return jsonable_encoder({"data": make_json_safe(df).to_dict("records"), "pagination": paginacion})
+
 # ==============================================
-# APIs DE MOLÉCULAS
+# MOTORES DE CONSULTA
 # ==============================================
 
-@app.get("/api/moleculas/stats")
-async def get_moleculas_stats(
-    molecule: Optional[str] = Query(None, description="Filtrar por molécula específica"),
-    countries: Optional[List[str]] = Query(None, description="Lista de países a incluir")
-):
-    """Obtener estadísticas básicas de moléculas"""
-    
-    df = data_cache.get('moleculas')
-    if df is None or df.empty:
-        raise HTTPException(status_code=500, detail="Datos de moléculas no disponibles")
-    
-    # Aplicar filtros
-    filtered_df = df.copy()
+# Metadatos de cada dataset consultable
+DATASETS = {
+    'moleculas': {
+        'cache_key': 'moleculas',
+        'tabla': 'moleculas',
+        'indices': ['Country', 'Molecule', 'Switch Year', 'dose_unit'],
+        'rangos': ['Switch Year', 'dose_amount'],
+        # Parámetro de la API -> columna para la navegación por facetas
+        'facetas': {'molecule': 'Molecule', 'countries': 'Country', 'dose_unit': 'dose_unit'},
+        # Columnas calculadas al cargar: solo se devuelven si se piden con fields=
+        'derivadas': COLUMNAS_DOSIS,
+        # Clave natural (la misma que usa load_moleculas_data para eliminar duplicados)
+        'clave': ['Molecule', 'Country', 'Switch Year', 'Strength'],
+        # Columnas booleanas: la ingesta solo acepta true/false/1/0
+        'booleanas': [],
+        'normalizar': normalizar_moleculas,
+        'mensaje_error': "Datos de moléculas no disponibles",
+    },
+    'suplementos': {
+        'cache_key': 'suplementos_principal',
+        'tabla': 'suplementos',
+        'indices': ['pais', 'ingrediente', 'tipo'],
+        'rangos': ['minimo', 'maximo'],
+        'facetas': {'ingredient': 'ingrediente', 'countries': 'pais', 'ingredient_type': 'tipo'},
+        'derivadas': [],
+        'clave': ['pais', 'ingrediente'],
+        'booleanas': ['establecido'],
+        'normalizar': normalizar_suplementos,
+        'mensaje_error': "Datos de suplementos no disponibles",
+    },
+}
+
+def _rangos_desde_parametros(**limites) -> Dict[str, tuple]:
+    """Agrupar pares (columna, mínimo, máximo) ignorando los rangos sin límites"""
+    return {
+        col: (minimo, maximo)
+        for col, (minimo, maximo) in limites.items()
+        if minimo is not None or maximo is not None
+    }
+
+def filtros_moleculas(
+    molecule: Optional[str] = None,
+    countries: Optional[List[str]] = None,
+    year_from: Optional[float] = None,
+    year_to: Optional[float] = None,
+    dose_unit: Optional[str] = None,
+    dose_from: Optional[float] = None,
+    dose_to: Optional[float] = None
+) -> Dict[str, Any]:
+    """Construir el estado de filtros de moléculas a partir de los parámetros de la API"""
+    igualdad = {}
     if molecule and molecule != "all":
-        filtered_df = filtered_df[filtered_df['Molecule'] == molecule]
+        igualdad['Molecule'] = [molecule]
     if countries:
-        filtered_df = filtered_df[filtered_df['Country'].isin(countries)]
+        igualdad['Country'] = traducir_paises('moleculas', countries)
+    if dose_unit:
+        igualdad['dose_unit'] = [dose_unit]
+    elif dose_from is not None or dose_to is not None:
+        # Sin unidad se compararían mg con ml, IU o %
+        raise HTTPException(status_code=400, detail="dose_from/dose_to requieren dose_unit")
+    rangos = _rangos_desde_parametros(**{
+        'Switch Year': (year_from, year_to),
+        'dose_amount': (dose_from, dose_to)
+    })
+    return {'igualdad': igualdad, 'rangos': rangos}
 
-    # Calcular rango de años
-    min_year = None
-    max_year = None
-    if 'Switch Year' in df.columns:
-        yy = pd.to_numeric(df['Switch Year'], errors='coerce').dropna()
-        if not yy.empty:
-            min_year = int(yy.min())
-            max_year = int(yy.max())
-    
+def filtros_suplementos(
+    ingredient: Optional[str] = None,
+    countries: Optional[List[str]] = None,
+    ingredient_type: Optional[str] = None,
+    minimo_from: Optional[float] = None,
+    minimo_to: Optional[float] = None,
+    maximo_from: Optional[float] = None,
+    maximo_to: Optional[float] = None
+) -> Dict[str, Any]:
+    """Construir el estado de filtros de suplementos a partir de los parámetros de la API"""
+    igualdad = {}
+    if ingredient and ingredient != "all":
+        igualdad['ingrediente'] = [ingredient]
+    if countries:
+        igualdad['pais'] = traducir_paises('suplementos', countries)
+    if ingredient_type and ingredient_type != "all":
+        igualdad['tipo'] = [ingredient_type]
+    rangos = _rangos_desde_parametros(minimo=(minimo_from, minimo_to), maximo=(maximo_from, maximo_to))
+    return {'igualdad': igualdad, 'rangos': rangos}
+
+def con_igualdad(filtros: Dict[str, Any], columna: str, valores: List[Any]) -> Dict[str, Any]:
+    """Devolver una copia de los filtros restringiendo además una columna a ciertos valores"""
+    actuales = filtros.get('igualdad', {}).get(columna)
+    if actuales is not None:
+        valores = [v for v in valores if v in actuales]
     return {
-        "total_records": len(filtered_df),
-        "unique_countries": filtered_df['Country'].nunique(),
-        "unique_molecules": filtered_df['Molecule'].nunique(),
-        "available_molecules": sorted(df['Molecule'].dropna().astype(str).unique().tolist()),
-        "available_countries": sorted(df['Country'].dropna().astype(str).unique().tolist()),
-        "date_range": {"min_year": min_year, "max_year": max_year}
+        'igualdad': {**filtros.get('igualdad', {}), columna: list(valores)},
+        'rangos': dict(filtros.get('rangos', {}))
     }
 
-@app.get("/api/moleculas/data")
-async def get_moleculas_data(
-    molecule: Optional[str] = Query(None),
-    countries: Optional[List[str]] = Query(None),
-    limit: int = Query(50, ge=1, le=1000, description="Número máximo de registros"),
-    offset: int = Query(0, ge=0, description="Offset para paginación")
-):
-    """Obtener datos de moléculas con paginación"""
-    df = data_cache.get('moleculas')
-    if df is None or df.empty:
-        raise HTTPException(status_code=500, detail="Datos de moléculas no disponibles")
+def columnas_por_defecto(nombre: str) -> List[str]:
+    """Columnas que devuelven los endpoints de datos cuando no se usa fields="""
+    derivadas = DATASETS[nombre]['derivadas']
+    return [c for c in obtener_motor(nombre).columnas if c not in derivadas]
 
-    # Aplicar filtros
-    filtered_df = df.copy()
-    if molecule and molecule != "all":
-        filtered_df = filtered_df[filtered_df['Molecule'] == molecule]
-    if countries and len(countries) > 0:
-        filtered_df = filtered_df[filtered_df['Country'].isin(countries)]
+def con_rango(filtros: Dict[str, Any], columna: str, minimo=None, maximo=None) -> Dict[str, Any]:
+    """Devolver una copia de los filtros intersectando un rango inclusivo adicional"""
+    actual_min, actual_max = filtros.get('rangos', {}).get(columna, (None, None))
+    if actual_min is not None:
+        minimo = actual_min if minimo is None else max(minimo, actual_min)
+    if actual_max is not None:
+        maximo = actual_max if maximo is None else min(maximo, actual_max)
+    return {
+        'igualdad': dict(filtros.get('igualdad', {})),
+        'rangos': {**filtros.get('rangos', {}), columna: (minimo, maximo)}
+    }
 
-    total_records = len(filtered_df)
-    paginated_df = filtered_df.iloc[offset:offset + limit].copy()
+class IndiceCategorico:
+    """Índice de igualdad: código por fila y posiciones agrupadas por valor"""
 
-    # Hacer JSON-safe
-    paginated_df = make_json_safe(paginated_df)
+    def __init__(self, serie: pd.Series):
+        codigos, valores = pd.factorize(serie, use_na_sentinel=True)
+        self.codigos = codigos.astype(np.int32)
+        self.valores = list(valores)
+        self.codigo_de = {v: i for i, v in enumerate(self.valores)}
+        # Posiciones ordenadas por código (los nulos, -1, quedan al principio)
+        self.orden = np.argsort(self.codigos, kind='stable')
+        self.inicios = np.searchsorted(self.codigos[self.orden], np.arange(len(self.valores) + 1))
 
-    payload = {
-        "data": paginated_df.to_dict("records"),
-        "pagination": {
-            "total": total_records,
-            "limit": limit,
-            "offset": offset,
-            "has_next": offset + limit < total_records
-        }
-    }
+    def codigos_para(self, valores: List[Any]) -> np.ndarray:
+        return np.array(sorted({self.codigo_de[v] for v in valores if v in self.codigo_de}), dtype=np.int32)
 
-    return JSONResponse(content=jsonable_encoder(payload))
+    def tamano(self, valores: List[Any]) -> int:
+        cods = self.codigos_para(valores)
+        return int((self.inicios[cods + 1] - self.inicios[cods]).sum())
 
-@app.get("/api/moleculas/charts")
-async def get_moleculas_charts(
-    molecule: Optional[str] = Query(None),
-    countries: Optional[List[str]] = Query(None)
-):
-    """Generar gráficos para el dashboard de moléculas"""
-    
-    df = data_cache.get('moleculas')
-    if df is None or df.empty:
-        raise HTTPException(status_code=500, detail="Datos de moléculas no disponibles")
-    
-    # Aplicar filtros
-    filtered_df = df.copy()
-    if molecule and molecule != "all":
-        filtered_df = filtered_df[filtered_df['Molecule'] == molecule]
-    if countries and len(countries) > 0:
-        filtered_df = filtered_df[filtered_df['Country'].isin(countries)]
-    
-    charts = {}
-    
-    try:
-        # Gráfico 1: Moléculas únicas por país
-        if {'Country', 'Molecule'}.issubset(filtered_df.columns) and not filtered_df.empty:
-            country_molecules = (
-                filtered_df.groupby('Country')['Molecule']
-                .nunique()
-                .sort_values(ascending=False)
-                .head(15)
-            )
-            if not country_molecules.empty:
-                fig_bar = px.bar(
-                    x=country_molecules.index,
-                    y=country_molecules.values,
-                    title="Número de moléculas únicas por país",
-                    labels={'x': 'País', 'y': 'Número de moléculas'},
-                    color=country_molecules.values,
-                    color_continuous_scale="viridis"
-                )
-                fig_bar.update_layout(
-                    xaxis_tickangle=-45, 
-                    height=400,
-                    showlegend=False,
-                    margin=dict(l=40, r=40, t=60, b=100),
-                    xaxis_title="País",
-                    yaxis_title="Número de moléculas"
-                )
-                charts['molecules_by_country'] = json.loads(json.dumps(fig_bar, cls=plotly.utils.PlotlyJSONEncoder))
-        
-        # Gráfico 2: Distribución RX vs OTC
-        if 'RX-OTC - Molecule' in filtered_df.columns and not filtered_df.empty:
-            rx_series = filtered_df['RX-OTC - Molecule'].astype(str).str.strip()
-            rx_series = rx_series.replace({'': None, 'nan': None, 'None': None, 'NaN': None})
-            rx_otc_counts = rx_series.dropna().value_counts()
-            if not rx_otc_counts.empty:
-                fig_pie = px.pie(
-                    values=rx_otc_counts.values,
-                    names=rx_otc_counts.index,
-                    title="Distribución por tipo de regulación (RX-OTC)"
-                )
-                fig_pie.update_layout(height=400)
-                charts['rx_otc_distribution'] = json.loads(json.dumps(fig_pie, cls=plotly.utils.PlotlyJSONEncoder))
-        
-        # Gráfico 3: Timeline de switches
-        if 'Switch Year' in filtered_df.columns and not filtered_df.empty:
-            yr = pd.to_numeric(filtered_df['Switch Year'], errors='coerce')
-            yr_mask = yr.between(1990, 2030, inclusive='both')
-            year_data = filtered_df.loc[yr_mask].copy()
-            
-            if not year_data.empty:
-                year_data['Switch Year'] = yr.loc[yr_mask]
-                year_counts = (year_data
-                               .groupby('Switch Year', dropna=True)
-                               .size()
-                               .reset_index(name='count')
-                               .sort_values('Switch Year'))
-                
-                if not year_counts.empty:
-                    fig_timeline = px.line(
-                        year_counts, 
-                        x='Switch Year', 
-                        y='count',
-                        title="Evolución de switches por año",
-                        markers=True
-                    )
-                    fig_timeline.update_layout(height=400)
-                    charts['switches_timeline'] = json.loads(json.dumps(fig_timeline, cls=plotly.utils.PlotlyJSONEncoder))
-        
-        # Gráfico 4: Top moléculas
-        if 'Molecule' in filtered_df.columns and not filtered_df.empty:
-            top_molecules = filtered_df['Molecule'].value_counts().head(10)
-            if not top_molecules.empty:
-                fig_top = px.bar(
-                    x=top_molecules.values,
-                    y=top_molecules.index,
-                    orientation='h',
-                    title="Top 10 moléculas más frecuentes",
-                    labels={'x': 'Número de registros', 'y': 'Molécula'}
-                )
-                fig_top.update_layout(
-                    height=400, 
-                    yaxis={'categoryorder': 'total ascending'},
-                    margin=dict(l=150, r=40, t=60, b=40)
-                )
-                charts['top_molecules'] = json.loads(json.dumps(fig_top, cls=plotly.utils.PlotlyJSONEncoder))
-        
-    except Exception as e:
-        logger.error(f"Error generando gráficos de moléculas: {e}")
-        raise HTTPException(status_code=500, detail=f"Error generando gráficos: {str(e)}")
-    
-    return charts
+    def posiciones(self, valores: List[Any]) -> np.ndarray:
+        partes = [self.orden[self.inicios[c]:self.inicios[c + 1]] for c in self.codigos_para(valores)]
+        return np.sort(np.concatenate(partes)) if partes else np.empty(0, dtype=np.intp)
 
-# ==============================================
-# APIs DE SUPLEMENTOS
-# ==============================================
+    def contiene(self, posiciones: np.ndarray, valores: List[Any]) -> np.ndarray:
+        return np.isin(self.codigos[posiciones], self.codigos_para(valores))
 
-@app.get("/api/suplementos/stats")
-async def get_suplementos_stats(
-    ingredient: Optional[str] = Query(None, description="Filtrar por ingrediente específico"),
-    countries: Optional[List[str]] = Query(None, description="Lista de países a incluir"),
-    ingredient_type: Optional[str] = Query(None, description="Filtrar por tipo de ingrediente")
-):
-    """Obtener estadísticas básicas de suplementos"""
-    
-    df = data_cache.get('suplementos_principal')
-    if df is None or df.empty:
-        raise HTTPException(status_code=500, detail="Datos de suplementos no disponibles")
-    
-    # Aplicar filtros
-    filtered_df = df.copy()
-    if ingredient and ingredient != "all":
-        filtered_df = filtered_df[filtered_df['ingrediente'] == ingredient]
-    if countries:
-        filtered_df = filtered_df[filtered_df['pais'].isin(countries)]
-    if ingredient_type and ingredient_type != "all":
-        filtered_df = filtered_df[filtered_df['tipo'] == ingredient_type]
-    
-    return {
-        "total_records": len(filtered_df),
-        "unique_countries": filtered_df['pais'].nunique(),
-        "unique_ingredients": filtered_df['ingrediente'].nunique(),
-        "unique_types": filtered_df['tipo'].nunique(),
-        "available_ingredients": sorted(df['ingrediente'].dropna().unique().tolist()),
-        "available_countries": sorted(df['pais'].dropna().unique().tolist()),
-        "available_types": sorted(df['tipo'].dropna().unique().tolist()),
-        "established_percentage": (filtered_df['establecido'].sum() / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
-    }
+    def mascara(self, valores: List[Any]) -> np.ndarray:
+        # Tabla de búsqueda por código (+1 para el centinela de nulos)
+        tabla = np.zeros(len(self.valores) + 1, dtype=bool)
+        tabla[self.codigos_para(valores) + 1] = True
+        return tabla[self.codigos + 1]
 
-@app.get("/api/suplementos/data")
-async def get_suplementos_data(
-    ingredient: Optional[str] = Query(None),
-    countries: Optional[List[str]] = Query(None),
-    ingredient_type: Optional[str] = Query(None),
-    limit: int = Query(50, ge=1, le=1000),
-    offset: int = Query(0, ge=0)
-):
-    """Obtener datos de suplementos con paginación"""
-    df = data_cache.get('suplementos_principal')
-    if df is None or df.empty:
-        raise HTTPException(status_code=500, detail="Datos de suplementos no disponibles")
+    def conteos(self, mascara: np.ndarray) -> np.ndarray:
+        codigos = self.codigos[mascara]
+        return np.bincount(codigos[codigos >= 0], minlength=len(self.valores))
 
-    # Aplicar filtros
-    filtered_df = df.copy()
-    if ingredient and ingredient != "all":
-        filtered_df = filtered_df[filtered_df['ingrediente'] == ingredient]
-    if countries and len(countries) > 0:
-        filtered_df = filtered_df[filtered_df['pais'].isin(countries)]
-    if ingredient_type and ingredient_type != "all":
-        filtered_df = filtered_df[filtered_df['tipo'] == ingredient_type]
+    def _codificar(self, valor) -> int:
+        if pd.isna(valor):
+            return -1
+        if valor not in self.codigo_de:
+            self.codigo_de[valor] = len(self.valores)
+            self.valores.append(valor)
+        return self.codigo_de[valor]
 
-    total_records = len(filtered_df)
-    paginated_df = filtered_df.iloc[offset:offset + limit].copy()
+    def con_delta(self, serie: pd.Series, delta: Dict[str, Any]) -> "IndiceCategorico":
+        """Nuevo índice tras un delta, sin reordenar las filas que no cambiaron"""
+        nuevo = IndiceCategorico.__new__(IndiceCategorico)
+        nuevo.valores = list(self.valores)
+        nuevo.codigo_de = dict(self.codigo_de)
+        borradas, actualizadas, cambiadas = delta['borradas'], delta['actualizadas'], delta['cambiadas']
 
-    # Hacer JSON-safe
-    paginated_df = make_json_safe(paginated_df)
+        codigos_cambiados = np.array([nuevo._codificar(v) for v in serie.iloc[cambiadas]], dtype=np.int32)
+        codigos = np.concatenate([np.delete(self.codigos, borradas), np.empty(delta['n_agregadas'], dtype=np.int32)])
+        codigos[cambiadas] = codigos_cambiados
 
-    payload = {
-        "data": paginated_df.to_dict("records"),
-        "pagination": {
-            "total": total_records,
-            "limit": limit,
-            "offset": offset,
-            "has_next": offset + limit < total_records
-        }
-    }
+        # Quitar filas borradas/reemplazadas, desplazar posiciones e insertar las nuevas
+        # manteniendo el orden por (código, posición)
+        orden = self.orden[~np.isin(self.orden, borradas)]
+        orden = orden - np.searchsorted(borradas, orden)
+        orden = orden[~np.isin(orden, actualizadas)]
+        llaves = ((codigos[orden].astype(np.int64) + 1) << 32) | orden
+        llaves_nuevas = np.sort(((codigos_cambiados.astype(np.int64) + 1) << 32) | cambiadas)
+        llaves = np.insert(llaves, np.searchsorted(llaves, llaves_nuevas), llaves_nuevas)
 
-    return JSONResponse(content=jsonable_encoder(payload))
+        nuevo.codigos = codigos
+        nuevo.orden = (llaves & 0xFFFFFFFF).astype(np.intp)
+        nuevo.inicios = np.searchsorted(llaves, (np.arange(len(nuevo.valores) + 1, dtype=np.int64) + 1) << 32)
+        return nuevo
 
-@app.get("/api/suplementos/charts")
-async def get_suplementos_charts(
-    ingredient: Optional[str] = Query(None),
-    countries: Optional[List[str]] = Query(None),
-    ingredient_type: Optional[str] = Query(None)
-):
-    """Generar gráficos para el dashboard de suplementos"""
-    
-    df = data_cache.get('suplementos_principal')
-    if df is None or df.empty:
-        raise HTTPException(status_code=500, detail="Datos de suplementos no disponibles")
-    
-    # Aplicar filtros
-    filtered_df = df.copy()
-    if ingredient and ingredient != "all":
-        filtered_df = filtered_df[filtered_df['ingrediente'] == ingredient]
-    if countries and len(countries) > 0:
-        filtered_df = filtered_df[filtered_df['pais'].isin(countries)]
-    if ingredient_type and ingredient_type != "all":
-        filtered_df = filtered_df[filtered_df['tipo'] == ingredient_type]
-    
-    charts = {}
-    
-    try:
-        # Gráfico 1: Ingredientes por país
-        if not filtered_df.empty:
-            country_ingredients = (
-                filtered_df.groupby('pais')['ingrediente']
-                .nunique()
-                .sort_values(ascending=False)
-                .head(15)
-            )
-            if not country_ingredients.empty:
-                fig_bar = px.bar(
-                    x=country_ingredients.index,
-                    y=country_ingredients.values,
-                    title="Número de ingredientes únicos por país",
+class IndiceRango:
+    """Índice de valores numéricos ordenados para filtros por rango (búsqueda binaria)"""
+
+    def __init__(self, serie: pd.Series):
+        self.numeros = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+        validos = np.flatnonzero(~np.isnan(self.numeros))
+        self.orden = validos[np.argsort(self.numeros[validos], kind='stable')]
+        self.ordenados = self.numeros[self.orden]
+
+    def _limites(self, minimo, maximo):
+        inicio = 0 if minimo is None else int(np.searchsorted(self.ordenados, minimo, side='left'))
+        fin = len(self.ordenados) if maximo is None else int(np.searchsorted(self.ordenados, maximo, side='right'))
+        return inicio, max(inicio, fin)
+
+    def tamano(self, minimo, maximo) -> int:
+        inicio, fin = self._limites(minimo, maximo)
+        return fin - inicio
+
+    def posiciones(self, minimo, maximo) -> np.ndarray:
+        inicio, fin = self._limites(minimo, maximo)
+        return np.sort(self.orden[inicio:fin])
+
+    def mascara(self, minimo, maximo) -> np.ndarray:
+        inicio, fin = self._limites(minimo, maximo)
+        mask = np.zeros(len(self.numeros), dtype=bool)
+        mask[self.orden[inicio:fin]] = True
+        return mask
+
+    def con_delta(self, serie: pd.Series, delta: Dict[str, Any]) -> "IndiceRango":
+        """Nuevo índice tras un delta: borrados e inserciones por búsqueda binaria, sin reordenar"""
+        nuevo = IndiceRango.__new__(IndiceRango)
+        borradas, actualizadas, cambiadas = delta['borradas'], delta['actualizadas'], delta['cambiadas']
+
+        valores_cambiados = pd.to_numeric(serie.iloc[cambiadas], errors='coerce').to_numpy(dtype=float)
+        numeros = np.concatenate([np.delete(self.numeros, borradas), np.full(delta['n_agregadas'], np.nan)])
+        numeros[cambiadas] = valores_cambiados
+
+        conservar = ~np.isin(self.orden, borradas)
+        orden, ordenados = self.orden[conservar], self.ordenados[conservar]
+        orden = orden - np.searchsorted(borradas, orden)
+        conservar = ~np.isin(orden, actualizadas)
+        orden, ordenados = orden[conservar], ordenados[conservar]
+
+        validos = ~np.isnan(valores_cambiados)
+        posiciones, valores = cambiadas[validos], valores_cambiados[validos]
+        por_valor = np.argsort(valores, kind='stable')
+        posiciones, valores = posiciones[por_valor], valores[por_valor]
+        destino = np.searchsorted(ordenados, valores, side='right')
+
+        nuevo.numeros = numeros
+        nuevo.ordenados = np.insert(ordenados, destino, valores)
+        nuevo.orden = np.insert(orden, destino, posiciones)
+        return nuevo
+
+    def contiene(self, posiciones: np.ndarray, minimo, maximo) -> np.ndarray:
+        valores = self.numeros[posiciones]
+        mask = ~np.isnan(valores)
+        if minimo is not None:
+            mask &= valores >= minimo
+        if maximo is not None:
+            mask &= valores <= maximo
+        return mask
+
+class MotorPandas:
+    """Motor en memoria: índices categóricos y ordenados sobre el DataFrame"""
+
+    nombre = "pandas"
+
+    def __init__(self, df: pd.DataFrame, indices: Optional[List[str]] = None, rangos: Optional[List[str]] = None):
+        self.df = df
+        self._categoricos: Dict[str, IndiceCategorico] = {}
+        self._rangos: Dict[str, IndiceRango] = {}
+        for col in indices or []:
+            if col in df.columns:
+                self.indice_categorico(col)
+        for col in rangos or []:
+            if col in df.columns:
+                self.indice_rango(col)
+
+    @property
+    def columnas(self) -> List[str]:
+        return list(self.df.columns)
+
+    def indice_categorico(self, columna: str) -> IndiceCategorico:
+        if columna not in self._categoricos:
+            self._categoricos[columna] = IndiceCategorico(self.df[columna])
+        return self._categoricos[columna]
+
+    def indice_rango(self, columna: str) -> IndiceRango:
+        if columna not in self._rangos:
+            self._rangos[columna] = IndiceRango(self.df[columna])
+        return self._rangos[columna]
+
+    def posiciones(self, filtros: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Posiciones (en orden del DataFrame) que cumplen los filtros; None si no hay filtros"""
+        condiciones = [
+            (self.indice_categorico(col), (valores,))
+            for col, valores in filtros.get('igualdad', {}).items()
+        ] + [
+            (self.indice_rango(col), limites)
+            for col, limites in filtros.get('rangos', {}).items()
+        ]
+        if not condiciones:
+            return None
+
+        # Partir del índice más selectivo y verificar el resto solo sobre esos candidatos
+        condiciones.sort(key=lambda c: c[0].tamano(*c[1]))
+        indice, args = condiciones[0]
+        posiciones = indice.posiciones(*args)
+        for indice, args in condiciones[1:]:
+            if len(posiciones) == 0:
+                break
+            posiciones = posiciones[indice.contiene(posiciones, *args)]
+        return posiciones
+
+    def filtrar(self, filtros: Dict[str, Any]) -> pd.DataFrame:
+        posiciones = self.posiciones(filtros)
+        return self.df if posiciones is None else self.df.iloc[posiciones]
+
+    def con_delta(self, delta: Dict[str, Any]) -> "MotorPandas":
+        """Motor sobre el DataFrame resultante de un delta, con índices actualizados incrementalmente"""
+        df = delta['df']
+        nuevo = MotorPandas(df)
+        nuevo._categoricos = {col: ind.con_delta(df[col], delta) for col, ind in self._categoricos.items()}
+        nuevo._rangos = {col: ind.con_delta(df[col], delta) for col, ind in self._rangos.items()}
+        return nuevo
+
+    def facetas(self, filtros: Dict[str, Any], columnas: List[str]) -> Dict[str, pd.Series]:
+        """Conteos por valor de cada columna aplicando todos los filtros excepto el de esa columna"""
+        condiciones = [
+            (col, self.indice_categorico(col).mascara(valores))
+            for col, valores in filtros.get('igualdad', {}).items()
+        ] + [
+            (col, self.indice_rango(col).mascara(*limites))
+            for col, limites in filtros.get('rangos', {}).items()
+        ]
+
+        # AND acumulados por prefijo y sufijo: la máscara "sin la condición i" sale en O(n)
+        n = len(self.df)
+        prefijos = [np.ones(n, dtype=bool)]
+        for _, mask in condiciones:
+            prefijos.append(prefijos[-1] & mask)
+        sufijos = [np.ones(n, dtype=bool)]
+        for _, mask in reversed(condiciones):
+            sufijos.append(sufijos[-1] & mask)
+        sufijos.reverse()
+        excluyendo = {
+            col: prefijos[i] & sufijos[i + 1]
+            for i, (col, _) in enumerate(condiciones)
+            if col in filtros.get('igualdad', {})
+        }
+
+        resultado = {}
+        for col in columnas:
+            indice = self.indice_categorico(col)
+            conteos = indice.conteos(excluyendo.get(col, prefijos[-1]))
+            presentes = np.flatnonzero(conteos)
+            resultado[col] = pd.Series(conteos[presentes], index=[indice.valores[i] for i in presentes])
+        return resultado
+
+    def contar(self, filtros: Dict[str, Any]) -> int:
+        posiciones = self.posiciones(filtros)
+        return len(self.df) if posiciones is None else len(posiciones)
+
+    def contar_distintos(self, filtros: Dict[str, Any], columna: str) -> int:
+        return int(self.filtrar(filtros)[columna].nunique())
+
+    def sumar(self, filtros: Dict[str, Any], columna: str):
+        return self.filtrar(filtros)[columna].sum()
+
+    def pagina(self, filtros: Dict[str, Any], limit: int, offset: int,
+               columnas: Optional[List[str]] = None) -> pd.DataFrame:
+        posiciones = self.posiciones(filtros)
+        filas = slice(offset, offset + limit) if posiciones is None else posiciones[offset:offset + limit]
+        if columnas is None:
+            return self.df.iloc[filas].copy()
+        # Proyectar antes de copiar: solo se copian las columnas pedidas
+        return self.df.iloc[filas, self.df.columns.get_indexer(columnas)].copy()
+
+    def conteo_por_valor(self, filtros: Dict[str, Any], columna: str, excluir: Optional[List[str]] = None) -> pd.Series:
+        serie = self.filtrar(filtros)[columna]
+        if excluir:
+            serie = serie[~serie.isin(excluir)]
+        return serie.value_counts()
+
+    def distintos_por_grupo(self, filtros: Dict[str, Any], grupo: str, columna: str) -> pd.Series:
+        return self.filtrar(filtros).groupby(grupo)[columna].nunique()
+
+    def valores_distintos(self, columna: str) -> List[str]:
+        return sorted(self.df[columna].dropna().astype(str).unique().tolist())
+
+    def min_max(self, columna: str):
+        valores = pd.to_numeric(self.df[columna], errors='coerce').dropna()
+        if valores.empty:
+            return None, None
+        return valores.min(), valores.max()
+
+def _sql_id(nombre: str) -> str:
+    """Citar un identificador SQL (los nombres de columna del Excel llevan espacios)"""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+def _valor_sqlite(valor):
+    """Convertir un valor de pandas/numpy a un tipo nativo de SQLite"""
+    if valor is None or valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, (bool, np.bool_)):
+        return int(valor)
+    if isinstance(valor, np.integer):
+        return int(valor)
+    if isinstance(valor, (float, np.floating)):
+        return None if np.isnan(valor) else float(valor)
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    return valor
+
+_conexiones_sqlite = threading.local()
+
+# Las tablas de cada proceso llevan su token: un proceso solo borra las propias o las de
+# procesos terminados (varios workers pueden compartir SQLITE_PATH)
+TOKEN_PROCESO = f"{os.getpid()}x{secrets.token_hex(3)}"
+_candados_sqlite: Dict[str, Any] = {}
+
+def _ruta_candado(ruta: str, token: str) -> str:
+    return f"{ruta}.{token}.lock"
+
+def registrar_proceso_sqlite(ruta: str):
+    """Bloquear, mientras viva el proceso, un archivo propio junto a la base (antes de crear tablas)"""
+    if fcntl is None or ruta in _candados_sqlite:
+        return
+    candado = open(_ruta_candado(ruta, TOKEN_PROCESO), 'w')
+    fcntl.flock(candado, fcntl.LOCK_EX)
+    _candados_sqlite[ruta] = candado
+
+def proceso_terminado(ruta: str, token: str) -> bool:
+    """True si el proceso del token ya no existe: su candado no está tomado (o ya no está)"""
+    if fcntl is None:
+        return False
+    ruta_candado = _ruta_candado(ruta, token)
+    try:
+        candado = open(ruta_candado, 'a')
+    except OSError:
+        return False
+    with candado:
+        try:
+            fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        if os.path.exists(ruta_candado):
+            os.remove(ruta_candado)
+    return True
+
+def conexion_sqlite(ruta: str) -> sqlite3.Connection:
+    """Conexión al archivo reutilizada por cada hilo (sqlite3 no comparte conexiones entre hilos)"""
+    conexiones = _conexiones_sqlite.__dict__.setdefault('por_ruta', {})
+    conn = conexiones.get(ruta)
+    if conn is None:
+        conn = sqlite3.connect(ruta)
+        # WAL: las lecturas no se bloquean mientras se carga otra tabla o se aplica un delta
+        conn.execute("PRAGMA journal_mode=WAL")
+        conexiones[ruta] = conn
+    return conn
+
+class MotorSQLite:
+    """Motor sobre un archivo SQLite local: filtros, conteos, agrupaciones y paginación en SQL.
+
+    Cada motor carga su propia tabla versionada (<tabla>__p<token>_v<ns>): una recarga llena una
+    tabla nueva mientras el motor anterior sigue leyendo la suya, y el cambio es el reemplazo del
+    motor. La tabla de un motor se borra en la carga siguiente a que deje de estar en uso; las de
+    otros procesos, solo cuando ese proceso terminó.
+    """
+
+    nombre = "sqlite"
+    # Tablas de motores todavía referenciados en este proceso (no se pueden borrar)
+    tablas_vivas: set = set()
+
+    def __init__(self, ruta: str, tabla: str, df: pd.DataFrame, indices: List[str], rangos: Optional[List[str]] = None):
+        columnas_indexadas = list(dict.fromkeys([*indices, *(rangos or [])]))
+        self._nueva_generacion(ruta, tabla, list(df.columns), df.dtypes.to_dict(),
+                               [c for c in columnas_indexadas if c in df.columns])
+        self._cargar(df)
+
+    def _nueva_generacion(self, ruta: str, base: str, columnas: List[str], dtypes: Dict[str, Any], indices: List[str]):
+        """Nombre de tabla propio para este motor y registro como tabla viva"""
+        self.ruta = ruta
+        self.base = base
+        self.tabla = f"{base}__p{TOKEN_PROCESO}_v{time.time_ns()}"
+        self.columnas = columnas
+        self.dtypes = dtypes
+        self.indices = indices
+        MotorSQLite.tablas_vivas.add(self.tabla)
+        registrar_proceso_sqlite(ruta)
+        # Al liberarse el motor (sin consultas en curso que lo usen) su tabla queda para borrar;
+        # no se toca la base desde el recolector de basura
+        weakref.finalize(self, MotorSQLite.tablas_vivas.discard, self.tabla).atexit = False
+
+    def _crear_tabla(self, conn: sqlite3.Connection):
+        # Sin tipo declarado: cada valor conserva su clase de almacenamiento original
+        definicion = ", ".join(_sql_id(c) for c in self.columnas)
+        conn.execute(f"CREATE TABLE {_sql_id(self.tabla)} (_orden INTEGER PRIMARY KEY, {definicion})")
+
+    def _crear_indices(self, conn: sqlite3.Connection):
+        for col in self.indices:
+            nombre_indice = _sql_id(f"ix_{self.tabla}_{col}")
+            conn.execute(f"CREATE INDEX {nombre_indice} ON {_sql_id(self.tabla)} ({_sql_id(col)})")
+
+    def _conexion(self) -> sqlite3.Connection:
+        return conexion_sqlite(self.ruta)
+
+    def _retirar_anteriores(self, conn: sqlite3.Connection):
+        """Borrar las generaciones propias sin motor vivo y las de procesos que ya terminaron"""
+        vivas = set(MotorSQLite.tablas_vivas)
+        patron = re.compile(rf"{re.escape(self.base)}__p(\d+x[0-9a-f]+)_v\d+")
+        por_token: Dict[str, List[str]] = {}
+        for (nombre,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+            coincidencia = patron.fullmatch(nombre)
+            if coincidencia:
+                por_token.setdefault(coincidencia.group(1), []).append(nombre)
+        viejas = [n for n in por_token.pop(TOKEN_PROCESO, []) if n not in vivas]
+        for token, tablas in por_token.items():
+            if proceso_terminado(self.ruta, token):
+                viejas.extend(tablas)
+        for nombre in viejas:
+            with conn:
+                conn.execute(f"DROP TABLE IF EXISTS {_sql_id(nombre)}")
+
+    def _cargar(self, df: pd.DataFrame):
+        marcadores = ", ".join("?" * (len(self.columnas) + 1))
+        filas = (
+            (orden, *(_valor_sqlite(v) for v in fila))
+            for orden, fila in enumerate(df.astype(object).itertuples(index=False, name=None))
+        )
+        conn = self._conexion()
+        with conn:
+            self._crear_tabla(conn)
+            conn.executemany(f"INSERT INTO {_sql_id(self.tabla)} VALUES ({marcadores})", filas)
+            self._crear_indices(conn)
+        self._retirar_anteriores(conn)
+        logger.info(f"🗄️ Tabla SQLite '{self.tabla}' creada en {self.ruta} ({len(df)} filas, índices: {self.indices})")
+
+    def _where(self, filtros: Dict[str, Any], extra: Optional[List[str]] = None):
+        clausulas, params = [], []
+        for col, valores in filtros.get('igualdad', {}).items():
+            clausulas.append(f"{_sql_id(col)} IN ({', '.join('?' * len(valores))})")
+            params.extend(_valor_sqlite(v) for v in valores)
+        for col, (minimo, maximo) in filtros.get('rangos', {}).items():
+            # Igual que pd.to_numeric(errors='coerce'): solo cuentan los valores numéricos
+            clausulas.append(f"typeof({_sql_id(col)}) IN ('integer', 'real')")
+            if minimo is not None:
+                clausulas.append(f"{_sql_id(col)} >= ?")
+                params.append(minimo)
+            if maximo is not None:
+                clausulas.append(f"{_sql_id(col)} <= ?")
+                params.append(maximo)
+        clausulas.extend(extra or [])
+        sql = (" WHERE " + " AND ".join(clausulas)) if clausulas else ""
+        return sql, params
+
+    def con_delta(self, delta: Dict[str, Any]) -> "MotorSQLite":
+        """Motor sobre una copia de la tabla con el delta aplicado (las filas actualizadas conservan su _orden).
+
+        Como en MotorPandas, la tabla vigente no se toca: si la ingesta falla después, el motor
+        publicado sigue intacto; el nuevo se publica al final con el resto del estado.
+        """
+        nuevo = MotorSQLite.__new__(MotorSQLite)
+        nuevo._nueva_generacion(self.ruta, self.base, self.columnas, self.dtypes, self.indices)
+        # Mismo criterio que preparar_delta: borrar todas las filas con la clave, reemplazar la primera
+        tabla = _sql_id(nuevo.tabla)
+        clave = delta['clave']
+        condicion = " AND ".join(f"{_sql_id(c)} IS ?" for c in clave)
+        asignaciones = ", ".join(f"{_sql_id(c)} = ?" for c in self.columnas)
+        marcadores = ", ".join("?" * (len(self.columnas) + 1))
+
+        def valores(df: pd.DataFrame, columnas: List[str]) -> List[tuple]:
+            return [tuple(_valor_sqlite(v) for v in fila)
+                    for fila in df[columnas].astype(object).itertuples(index=False, name=None)]
+
+        conn = nuevo._conexion()
+        with conn:
+            nuevo._crear_tabla(conn)
+            conn.execute(f"INSERT INTO {tabla} SELECT * FROM {_sql_id(self.tabla)}")
+            conn.executemany(f"DELETE FROM {tabla} WHERE {condicion}", valores(delta['filas_borradas'], clave))
+            conn.executemany(
+                f"UPDATE {tabla} SET {asignaciones} "
+                f"WHERE _orden = (SELECT MIN(_orden) FROM {tabla} WHERE {condicion})",
+                [n + v for n, v in zip(valores(delta['filas_actualizadas'], self.columnas),
+                                       valores(delta['filas_reemplazadas'], clave))]
+            )
+            siguiente = conn.execute(f"SELECT COALESCE(MAX(_orden), -1) + 1 FROM {tabla}").fetchone()[0]
+            conn.executemany(
+                f"INSERT INTO {tabla} VALUES ({marcadores})",
+                [(siguiente + i, *fila) for i, fila in enumerate(valores(delta['filas_nuevas'], self.columnas))]
+            )
+            nuevo._crear_indices(conn)
+        nuevo._retirar_anteriores(conn)
+        return nuevo
+
+    def _consultar(self, sql: str, params=()) -> List[tuple]:
+        return self._conexion().execute(sql, list(params)).fetchall()
+
+    def _restaurar_tipos(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Devolver a cada columna el dtype que tenía en el DataFrame original"""
+        for col, dtype in self.dtypes.items():
+            if col not in df.columns:
+                continue
+            if is_datetime64_any_dtype(dtype):
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+            elif dtype == bool and df[col].notna().all():
+                df[col] = df[col].astype(bool)
+            elif pd.api.types.is_float_dtype(dtype):
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+            elif pd.api.types.is_integer_dtype(dtype) and df[col].notna().all():
+                df[col] = df[col].astype(dtype)
+        return df
+
+    def contar(self, filtros: Dict[str, Any]) -> int:
+        where, params = self._where(filtros)
+        return self._consultar(f"SELECT COUNT(*) FROM {_sql_id(self.tabla)}{where}", params)[0][0]
+
+    def contar_distintos(self, filtros: Dict[str, Any], columna: str) -> int:
+        where, params = self._where(filtros)
+        sql = f"SELECT COUNT(DISTINCT {_sql_id(columna)}) FROM {_sql_id(self.tabla)}{where}"
+        return self._consultar(sql, params)[0][0]
+
+    def sumar(self, filtros: Dict[str, Any], columna: str):
+        where, params = self._where(filtros)
+        sql = f"SELECT COALESCE(SUM({_sql_id(columna)}), 0) FROM {_sql_id(self.tabla)}{where}"
+        return self._consultar(sql, params)[0][0]
+
+    def pagina(self, filtros: Dict[str, Any], limit: int, offset: int,
+               columnas: Optional[List[str]] = None) -> pd.DataFrame:
+        where, params = self._where(filtros)
+        columnas = columnas or self.columnas
+        seleccion = ", ".join(_sql_id(c) for c in columnas)
+        sql = f"SELECT {seleccion} FROM {_sql_id(self.tabla)}{where} ORDER BY _orden LIMIT ? OFFSET ?"
+        filas = self._consultar(sql, [*params, limit, offset])
+        return self._restaurar_tipos(pd.DataFrame(filas, columns=columnas))
+
+    def conteo_por_valor(self, filtros: Dict[str, Any], columna: str, excluir: Optional[List[str]] = None) -> pd.Series:
+        col = _sql_id(columna)
+        extra = [f"{col} IS NOT NULL"]
+        if excluir:
+            extra.append(f"{col} NOT IN ({', '.join('?' * len(excluir))})")
+        where, params = self._where(filtros, extra)
+        # Orden de primera aparición + sort_values: mismo desempate que value_counts()
+        sql = f"SELECT {col}, COUNT(*) FROM {_sql_id(self.tabla)}{where} GROUP BY {col} ORDER BY MIN(_orden)"
+        filas = self._consultar(sql, [*params, *(excluir or [])])
+        serie = pd.Series([f[1] for f in filas], index=pd.Index([f[0] for f in filas], name=columna),
+                          name='count', dtype='int64')
+        return serie.sort_values(ascending=False)
+
+    def distintos_por_grupo(self, filtros: Dict[str, Any], grupo: str, columna: str) -> pd.Series:
+        g = _sql_id(grupo)
+        where, params = self._where(filtros, [f"{g} IS NOT NULL"])
+        sql = (f"SELECT {g}, COUNT(DISTINCT {_sql_id(columna)}) FROM {_sql_id(self.tabla)}{where} "
+               f"GROUP BY {g} ORDER BY {g}")
+        filas = self._consultar(sql, params)
+        return pd.Series([f[1] for f in filas], index=pd.Index([f[0] for f in filas], name=grupo),
+                         name=columna, dtype='int64')
+
+    def facetas(self, filtros: Dict[str, Any], columnas: List[str]) -> Dict[str, pd.Series]:
+        """Conteos por valor de cada columna aplicando todos los filtros excepto el de esa columna"""
+        resultado = {}
+        for columna in columnas:
+            col = _sql_id(columna)
+            propios = {
+                'igualdad': {c: v for c, v in filtros.get('igualdad', {}).items() if c != columna},
+                'rangos': filtros.get('rangos', {})
+            }
+            where, params = self._where(propios, [f"{col} IS NOT NULL"])
+            filas = self._consultar(f"SELECT {col}, COUNT(*) FROM {_sql_id(self.tabla)}{where} GROUP BY {col}", params)
+            resultado[columna] = pd.Series([f[1] for f in filas], index=[f[0] for f in filas], dtype='int64')
+        return resultado
+
+    def valores_distintos(self, columna: str) -> List[str]:
+        col = _sql_id(columna)
+        filas = self._consultar(f"SELECT DISTINCT {col} FROM {_sql_id(self.tabla)} WHERE {col} IS NOT NULL")
+        return sorted(str(f[0]) for f in filas)
+
+    def min_max(self, columna: str):
+        col = _sql_id(columna)
+        sql = (f"SELECT MIN({col}), MAX({col}) FROM {_sql_id(self.tabla)} "
+               f"WHERE typeof({col}) IN ('integer', 'real')")
+        return tuple(self._consultar(sql)[0])
+
+def construir_motores():
+    """Crear el motor de consulta configurado para cada dataset cargado"""
+    backend = DATA_BACKEND
+    if backend not in ("pandas", "sqlite"):
+        logger.warning(f"⚠️ DATA_BACKEND '{backend}' no soportado, usando pandas")
+        backend = "pandas"
+
+    motores = {}
+    for nombre, spec in DATASETS.items():
+        df = data_cache.get(spec['cache_key'])
+        if df is None or df.empty:
+            motores[nombre] = None
+        elif backend == "sqlite":
+            motores[nombre] = MotorSQLite(SQLITE_PATH, spec['tabla'], df, spec['indices'], spec['rangos'])
+        else:
+            motores[nombre] = MotorPandas(df, spec['indices'], spec['rangos'])
+
+    data_cache['motores'] = motores
+    data_cache['claves'] = {}
+    logger.info(f"⚙️ Motor de consultas: {backend}")
+
+def calcular_facetas(filtros: Dict[str, Any], nombre: str) -> Dict[str, Any]:
+    """Respuesta de facetas: para cada dimensión, valores con su conteo bajo los demás filtros"""
+    motor = obtener_motor(nombre)
+    dimensiones = {p: c for p, c in DATASETS[nombre]['facetas'].items() if c in motor.columnas}
+    conteos = motor.facetas(filtros, list(dimensiones.values()))
+    return {
+        "total_records": motor.contar(filtros),
+        "facets": {
+            parametro: [
+                {"value": valor, "count": int(cantidad)}
+                for valor, cantidad in sorted(conteos[columna].items(), key=lambda item: str(item[0]))
+            ]
+            for parametro, columna in dimensiones.items()
+        }
+    }
+
+def obtener_motor(nombre: str):
+    """Obtener el motor de un dataset o fallar con el error habitual de datos no disponibles"""
+    motor = data_cache.get('motores', {}).get(nombre)
+    if motor is None:
+        raise HTTPException(status_code=500, detail=DATASETS[nombre]['mensaje_error'])
+    return motor
+
+# ==============================================
+# CACHE DE RESULTADOS Y COALESCENCIA
+# ==============================================
+
+class CacheResultados:
+    """Cache LRU de resultados de API, invalidable por dataset y acotada por entradas y por bytes
+
+    Una vez compilado el cuerpo de una entrada se descarta su valor: los aciertos se sirven del cuerpo.
+    """
+
+    def __init__(self, max_entradas: int, max_bytes: int):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entradas: "OrderedDict[str, Any]" = OrderedDict()
+        # Se incrementa en cada invalidación: un cómputo iniciado antes no puede guardar su resultado
+        self.generaciones: Dict[str, int] = {nombre: 0 for nombre in DATASETS}
+        self.metricas = {'hits': 0, 'misses': 0, 'invalidated': 0}
+
+    def obtener(self, clave: str):
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            self.metricas['misses'] += 1
+            return None
+        self._entradas.move_to_end(clave)
+        self.metricas['hits'] += 1
+        return entrada['valor']
+
+    def guardar(self, clave: str, valor, dataset: str, generacion: int, vista: str, filtros: Dict[str, Any]):
+        if self.max_entradas <= 0 or generacion != self.generaciones[dataset]:
+            return
+        self._retirar(clave)
+        self._entradas[clave] = {
+            'valor': valor, 'dataset': dataset, 'vista': vista, 'igualdad': filtros.get('igualdad', {}), 'bytes': 0
+        }
+        self._recortar()
+
+    def cuerpo(self, clave: str, generacion: int) -> Optional["RecursoCompilado"]:
+        """Cuerpo serializado y precomprimido del resultado, si se generó en esta generación del dataset"""
+        entrada = self._entradas.get(clave)
+        if entrada is None or entrada.get('cuerpo') is None or entrada['cuerpo'][0] != generacion:
+            return None
+        self._entradas.move_to_end(clave)
+        self.metricas['hits'] += 1
+        return entrada['cuerpo'][1]
+
+    def guardar_cuerpo(self, clave: str, dataset: str, generacion: int, recurso: "RecursoCompilado"):
+        entrada = self._entradas.get(clave)
+        if entrada is None or generacion != self.generaciones[dataset]:
+            return
+        tamano = len(recurso.contenido) + sum(len(v) for v in recurso.variantes.values())
+        entrada['cuerpo'] = (generacion, recurso)
+        entrada['valor'] = None
+        self.bytes += tamano - entrada['bytes']
+        entrada['bytes'] = tamano
+        self._entradas.move_to_end(clave)
+        self._recortar()
+
+    def _retirar(self, clave: str) -> bool:
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return False
+        self.bytes -= entrada['bytes']
+        return True
+
+    def _recortar(self):
+        """Expulsar las entradas menos usadas hasta respetar ambos topes"""
+        while self._entradas and (len(self._entradas) > self.max_entradas or self.bytes > self.max_bytes):
+            self._retirar(next(iter(self._entradas)))
+
+    def invalidar(self, dataset: Optional[str] = None):
+        """Descartar los resultados de un dataset (o de todos)"""
+        datasets = [dataset] if dataset else list(self.generaciones)
+        prefijos = tuple(f"{d}|" for d in datasets)
+        claves = [c for c in self._entradas if c.startswith(prefijos)]
+        for clave in claves:
+            self._retirar(clave)
+        for d in datasets:
+            self.generaciones[d] += 1
+        self.metricas['invalidated'] += len(claves)
+
+    def invalidar_por_filas(self, dataset: str, filas: pd.DataFrame):
+        """Descartar solo los resultados que dependen de alguna de las filas modificadas"""
+        claves = [
+            clave for clave, entrada in self._entradas.items()
+            if entrada['dataset'] == dataset and self._afectada(entrada, filas)
+        ]
+        for clave in claves:
+            self._retirar(clave)
+        self.generaciones[dataset] += 1
+        # Las entradas que sobreviven siguen siendo correctas: su cuerpo pasa a la nueva generación
+        generacion = self.generaciones[dataset]
+        for entrada in self._entradas.values():
+            if entrada['dataset'] == dataset and entrada.get('cuerpo') is not None:
+                entrada['cuerpo'] = (generacion, entrada['cuerpo'][1])
+        self.metricas['invalidated'] += len(claves)
+
+    @staticmethod
+    def _afectada(entrada: Dict[str, Any], filas: pd.DataFrame) -> bool:
+        if filas.empty:
+            return False
+        # Las estadísticas incluyen listas globales (available_*, date_range): dependen de todo el dataset
+        if entrada['vista'] == 'stats' or not entrada['igualdad']:
+            return True
+        coincidencias = sum(
+            filas[col].isin(valores).to_numpy(dtype=int) if col in filas.columns else 1
+            for col, valores in entrada['igualdad'].items()
+        )
+        # Las facetas cuentan cada dimensión ignorando su propio filtro
+        tolerancia = 1 if entrada['vista'] == 'facets' else 0
+        return bool(np.any(coincidencias >= len(entrada['igualdad']) - tolerancia))
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entradas), "max_entries": self.max_entradas,
+            "bytes": self.bytes, "max_bytes": self.max_bytes, **self.metricas
+        }
+
+class SingleFlight:
+    """Deduplicación en vuelo: peticiones concurrentes con la misma clave esperan un único cómputo"""
+
+    def __init__(self):
+        self._en_curso: Dict[str, asyncio.Future] = {}
+        self.metricas = {'executed': 0, 'coalesced': 0}
+
+    async def ejecutar(self, clave: str, funcion, *args):
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            # El cómputo vive en su propia tarea: si el cliente que lo inició se desconecta, los demás siguen esperándolo
+            tarea = asyncio.ensure_future(run_in_threadpool(funcion, *args))
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda t: self._liberar(clave, t))
+            self.metricas['executed'] += 1
+        else:
+            self.metricas['coalesced'] += 1
+        return await asyncio.shield(tarea)
+
+    def _liberar(self, clave: str, tarea: asyncio.Future):
+        if self._en_curso.get(clave) is tarea:
+            del self._en_curso[clave]
+        if not tarea.cancelled():
+            tarea.exception()  # evitar el aviso de excepción no recuperada si nadie esperaba ya
+
+    def estado(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._en_curso), **self.metricas}
+
+cache_resultados = CacheResultados(RESULT_CACHE_SIZE, RESULT_CACHE_MAX_BYTES)
+single_flight = SingleFlight()
+# Serialización de cuerpos: instancia propia para no mezclar sus métricas con las de los cómputos
+cuerpos_en_vuelo = SingleFlight()
+
+def clave_consulta(dataset: str, vista: str, filtros: Dict[str, Any], *extra) -> str:
+    """Clave normalizada: el orden de los países o parámetros repetidos no generan claves distintas"""
+    normalizados = {
+        'igualdad': {col: sorted({str(v) for v in valores}) for col, valores in filtros.get('igualdad', {}).items()},
+        'rangos': {col: list(limites) for col, limites in filtros.get('rangos', {}).items()}
+    }
+    return f"{dataset}|{vista}|{json.dumps(normalizados, sort_keys=True, ensure_ascii=False)}|{json.dumps(extra)}"
+
+async def resultado_cacheado(dataset: str, vista: str, filtros: Dict[str, Any], funcion, *args):
+    """Servir desde cache o calcular una sola vez fuera del event loop, compartiendo el cómputo en curso"""
+    clave = clave_consulta(dataset, vista, filtros, *args)
+    valor = cache_resultados.obtener(clave)
+    if valor is not None:
+        return valor
+
+    generacion = cache_resultados.generaciones[dataset]
+    valor = await single_flight.ejecutar(f"{generacion}|{clave}", funcion, filtros, *args)
+    cache_resultados.guardar(clave, valor, dataset, generacion, vista, filtros)
+    return valor
+
+# Gzip/brotli rápidos: el cuerpo se comprime una vez por versión y se reutiliza en cada acierto
+NIVELES_COMPRESION_API = (6, 5)
+
+metricas_compresion = {
+    'responses': 0, 'bytes_uncompressed': 0, 'bytes_sent': 0,
+    'by_encoding': {}, 'bodies_built': 0, 'build_cpu_ms': 0.0, 'serve_cpu_ms': 0.0
+}
+
+def construir_cuerpo(valor) -> "RecursoCompilado":
+    """Serializar como lo haría JSONResponse y precomprimir si supera el umbral"""
+    inicio = time.thread_time()
+    contenido = json.dumps(
+        jsonable_encoder(valor), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+    recurso = RecursoCompilado(
+        contenido, "application/json", len(contenido) >= COMPRESS_MIN_BYTES, NIVELES_COMPRESION_API
+    )
+    metricas_compresion['bodies_built'] += 1
+    metricas_compresion['build_cpu_ms'] += (time.thread_time() - inicio) * 1000
+    return recurso
+
+async def respuesta_cacheada(request: Request, dataset: str, vista: str, filtros: Dict[str, Any],
+                             funcion, *args) -> Response:
+    """Como resultado_cacheado, pero sirviendo bytes ya serializados y comprimidos según Accept-Encoding"""
+    # Generación del dataset antes de obtener el valor: si cambia mientras tanto, el cuerpo no se guarda
+    generacion = cache_resultados.generaciones[dataset]
+    inicio = time.thread_time()
+    clave = clave_consulta(dataset, vista, filtros, *args)
+    recurso = cache_resultados.cuerpo(clave, generacion)
+    if recurso is None:
+        valor = await resultado_cacheado(dataset, vista, filtros, funcion, *args)
+        recurso = await cuerpos_en_vuelo.ejecutar(f"{generacion}|{clave}", construir_cuerpo, valor)
+        cache_resultados.guardar_cuerpo(clave, dataset, generacion, recurso)
+        inicio = time.thread_time()
+
+    response = respuesta_recurso(recurso, request.headers, "no-cache")
+    codificacion = response.headers.get("content-encoding", "identity")
+    metricas_compresion['responses'] += 1
+    metricas_compresion['bytes_uncompressed'] += len(recurso.contenido)
+    metricas_compresion['bytes_sent'] += len(response.body)
+    metricas_compresion['by_encoding'][codificacion] = metricas_compresion['by_encoding'].get(codificacion, 0) + 1
+    metricas_compresion['serve_cpu_ms'] += (time.thread_time() - inicio) * 1000
+    return response
+
+def estado_compresion() -> Dict[str, Any]:
+    m = metricas_compresion
+    return {
+        **m,
+        "build_cpu_ms": round(m['build_cpu_ms'], 2),
+        "serve_cpu_ms": round(m['serve_cpu_ms'], 2),
+        "body_builds": cuerpos_en_vuelo.estado(),
+        "brotli_available": brotli is not None,
+        "min_bytes": COMPRESS_MIN_BYTES,
+        "ratio": round(m['bytes_sent'] / m['bytes_uncompressed'], 3) if m['bytes_uncompressed'] else None
+    }
+
+# ==============================================
+# CONTROL DE ADMISIÓN
+# ==============================================
+
+# Prioridad por clase (menor = se despacha antes) y límite de concurrencia propio
+CLASES_ADMISION = {
+    'light': {'prioridad': 0, 'concurrencia': None},
+    'standard': {'prioridad': 1, 'concurrencia': None},
+    'heavy': {'prioridad': 2, 'concurrencia': ADMISSION_HEAVY_CONCURRENCY},
+}
+
+# Primer prefijo que coincide; lo que no es /api/ (health, estáticos, páginas) no pasa por la admisión,
+# tampoco el canal de eventos, cuyas conexiones quedan abiertas
+RUTAS_ADMISION = [
+    ('/api/events', None),
+    ('/api/moleculas/charts', 'heavy'),
+    ('/api/suplementos/charts', 'heavy'),
+    ('/api/moleculas/data', 'heavy'),
+    ('/api/suplementos/data', 'heavy'),
+    ('/api/ingest/', 'heavy'),
+    ('/api/reload-data', 'heavy'),
+    ('/api/moleculas/', 'standard'),
+    ('/api/suplementos/stats', 'standard'),
+    ('/api/suplementos/facets', 'standard'),
+    ('/api/', 'light'),
+]
+
+def clasificar_ruta(path: str) -> Optional[str]:
+    for prefijo, clase in RUTAS_ADMISION:
+        if path.startswith(prefijo):
+            return clase
+    return None
+
+REDES_PROXY = [ipaddress.ip_network(p, strict=False) for p in TRUSTED_PROXIES if p != "*"]
+
+def es_proxy_confiable(ip: str) -> bool:
+    try:
+        direccion = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(direccion in red for red in REDES_PROXY)
+
+def identificar_cliente(request: Request) -> str:
+    # Las consultas reproducidas en proceso traen su identidad en el scope, no en cabeceras
+    propio = request.scope.get("state", {}).get("cliente")
+    if propio:
+        return propio
+    directo = request.client.host if request.client else None
+    if directo and ("*" in TRUSTED_PROXIES or es_proxy_confiable(directo)):
+        # Cada proxy agrega a la derecha la IP que le habló: la primera desde la derecha que no
+        # sea un proxy de confianza es el cliente; lo que está más a la izquierda lo controla él
+        saltos = [s.strip() for s in ",".join(request.headers.getlist("x-forwarded-for")).split(",") if s.strip()]
+        for salto in reversed(saltos):
+            if not es_proxy_confiable(salto):
+                return salto
+        if saltos:
+            return saltos[0]
+    return directo or "desconocido"
+
+class RechazoAdmision(Exception):
+    def __init__(self, status: int, motivo: str, retry_after: int):
+        self.status = status
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+class ControlAdmision:
+    """Límites de concurrencia por clase de ruta con una cola de prioridad acotada.
+
+    Las rutas livianas se despachan antes que las pesadas, cada cliente tiene un máximo
+    de peticiones en curso + en cola, y lo que no cabe se rechaza de inmediato (429/503).
+    """
+
+    def __init__(self, max_concurrencia: int, max_cola: int, por_cliente: int, espera_maxima: float):
+        self.max_concurrencia = max_concurrencia
+        self.max_cola = max_cola
+        self.por_cliente = por_cliente
+        self.espera_maxima = espera_maxima
+        self.en_curso = 0
+        self.en_curso_clase = {clase: 0 for clase in CLASES_ADMISION}
+        self.por_cliente_activas: Dict[str, int] = {}
+        self._cola: List[tuple] = []
+        self._secuencia = itertools.count()
+        self.duracion_media = {clase: 0.1 for clase in CLASES_ADMISION}
+        self.metricas = {'admitted': 0, 'queued': 0, 'rejected_queue_full': 0,
+                         'rejected_client_limit': 0, 'rejected_timeout': 0, 'dropped_disconnected': 0}
+
+    def _hay_lugar(self, clase: str) -> bool:
+        limite = CLASES_ADMISION[clase]['concurrencia']
+        return self.en_curso < self.max_concurrencia and (limite is None or self.en_curso_clase[clase] < limite)
+
+    def _ocupar(self, clase: str):
+        self.en_curso += 1
+        self.en_curso_clase[clase] += 1
+        self.metricas['admitted'] += 1
+
+    def _retry_after(self, clase: str) -> int:
+        # Tiempo estimado para vaciar la cola actual con la concurrencia disponible
+        espera = self.duracion_media[clase] * (len(self._cola) + 1) / max(1, self.max_concurrencia)
+        return max(1, math.ceil(espera))
+
+    def _purgar(self):
+        # Quitar esperas vencidas o canceladas para que no bloqueen el paso directo
+        vigentes = [entrada for entrada in self._cola if not entrada[-1]['fin'].done()]
+        if len(vigentes) != len(self._cola):
+            heapq.heapify(vigentes)
+            self._cola = vigentes
+
+    async def adquirir(self, clase: str, cliente: str, desconectado=None):
+        """Ocupar un lugar o esperarlo en la cola; desconectado() se consulta mientras se espera"""
+        self._purgar()
+        activas = self.por_cliente_activas.get(cliente, 0)
+        if self.por_cliente > 0 and activas >= self.por_cliente:
+            self.metricas['rejected_client_limit'] += 1
+            raise RechazoAdmision(429, "Demasiadas peticiones simultáneas de este cliente", self._retry_after(clase))
+
+        prioridad = CLASES_ADMISION[clase]['prioridad']
+        if self._hay_lugar(clase) and not any(p <= prioridad for p, *_ in self._cola):
+            self._ocupar(clase)
+            self.por_cliente_activas[cliente] = activas + 1
+            return
+
+        if len(self._cola) >= self.max_cola:
+            # Cola llena: una petición más prioritaria desplaza a la última de menor prioridad
+            peor = max(self._cola) if self._cola else None
+            if peor is None or peor[0] <= prioridad:
+                self.metricas['rejected_queue_full'] += 1
+                raise RechazoAdmision(503, "Servidor saturado, intente nuevamente", self._retry_after(clase))
+            self._cola.remove(peor)
+            heapq.heapify(self._cola)
+            self.metricas['rejected_queue_full'] += 1
+            peor[-1]['fin'].set_exception(
+                RechazoAdmision(503, "Servidor saturado, intente nuevamente", self._retry_after(peor[-1]['clase']))
+            )
+
+        # Entre iguales, primero el cliente con menos peticiones en curso
+        espera = {'clase': clase, 'fin': asyncio.get_running_loop().create_future()}
+        heapq.heappush(self._cola, (prioridad, activas, next(self._secuencia), espera))
+        self.por_cliente_activas[cliente] = activas + 1
+        self.metricas['queued'] += 1
+        try:
+            await self._esperar(espera['fin'], desconectado)
+        except RechazoAdmision:
+            self._soltar_cliente(cliente)
+            raise
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if espera['fin'].done() and not espera['fin'].cancelled():
+                # El lugar se concedió justo al vencer la espera: devolverlo
+                self.liberar(clase, cliente)
+            else:
+                espera['fin'].cancel()
+                self._soltar_cliente(cliente)
+            if isinstance(e, asyncio.TimeoutError):
+                self.metricas['rejected_timeout'] += 1
+                raise RechazoAdmision(503, "Tiempo de espera en cola agotado", self._retry_after(clase))
+            raise
+        except ConnectionAbortedError:
+            # El cliente se fue mientras esperaba: su lugar en la cola no debe demorar a los demás
+            if espera['fin'].done() and not espera['fin'].cancelled():
+                self.liberar(clase, cliente)
+            else:
+                espera['fin'].cancel()
+                self._soltar_cliente(cliente)
+                self._purgar()
+            self.metricas['dropped_disconnected'] += 1
+            raise RechazoAdmision(499, "Cliente desconectado", 0)
+
+    async def _esperar(self, fin: asyncio.Future, desconectado):
+        """Esperar el lugar hasta espera_maxima, revisando cada tanto si el cliente sigue conectado"""
+        if desconectado is None:
+            await asyncio.wait_for(asyncio.shield(fin), self.espera_maxima)
+            return
+        limite = time.monotonic() + self.espera_maxima
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise asyncio.TimeoutError()
+            await asyncio.wait({fin}, timeout=min(restante, ADMISSION_DISCONNECT_POLL))
+            if fin.done():
+                fin.result()
+                return
+            if await desconectado():
+                raise ConnectionAbortedError()
+
+    def _soltar_cliente(self, cliente: str):
+        restantes = self.por_cliente_activas.get(cliente, 1) - 1
+        if restantes > 0:
+            self.por_cliente_activas[cliente] = restantes
+        else:
+            self.por_cliente_activas.pop(cliente, None)
+
+    def liberar(self, clase: str, cliente: str, duracion: Optional[float] = None):
+        self.en_curso -= 1
+        self.en_curso_clase[clase] -= 1
+        self._soltar_cliente(cliente)
+        if duracion is not None:
+            self.duracion_media[clase] = 0.8 * self.duracion_media[clase] + 0.2 * duracion
+        self._despachar()
+
+    def _despachar(self):
+        """Conceder lugares libres en orden de prioridad; una clase sin cupo no bloquea a las demás"""
+        pendientes = []
+        while self._cola and self.en_curso < self.max_concurrencia:
+            entrada = heapq.heappop(self._cola)
+            espera = entrada[-1]
+            if espera['fin'].done():
+                continue
+            if self._hay_lugar(espera['clase']):
+                self._ocupar(espera['clase'])
+                espera['fin'].set_result(True)
+            else:
+                pendientes.append(entrada)
+        for entrada in pendientes:
+            heapq.heappush(self._cola, entrada)
+
+    def estado(self) -> Dict[str, Any]:
+        profundidad = {clase: 0 for clase in CLASES_ADMISION}
+        for *_, espera in self._cola:
+            if not espera['fin'].done():
+                profundidad[espera['clase']] += 1
+        return {
+            "enabled": ADMISSION_CONTROL,
+            "in_flight": self.en_curso,
+            "in_flight_by_class": dict(self.en_curso_clase),
+            "queue_depth": sum(profundidad.values()),
+            "queue_depth_by_class": profundidad,
+            "clients_active": len(self.por_cliente_activas),
+            **self.metricas
+        }
+
+control_admision = ControlAdmision(
+    ADMISSION_MAX_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_PER_CLIENT, ADMISSION_QUEUE_TIMEOUT
+)
+
+@app.middleware("http")
+async def admision_middleware(request: Request, call_next):
+    """Aplicar el control de admisión a las rutas de API"""
+    clase = clasificar_ruta(request.url.path) if ADMISSION_CONTROL else None
+    if clase is None:
+        return await call_next(request)
+
+    cliente = identificar_cliente(request)
+    # Revisar la desconexión lee el siguiente mensaje de receive: solo sin cuerpo que preservar
+    desconectado = request.is_disconnected if request.method in ("GET", "HEAD") else None
+    try:
+        await control_admision.adquirir(clase, cliente, desconectado)
+    except RechazoAdmision as rechazo:
+        return JSONResponse(
+            status_code=rechazo.status,
+            content={"message": rechazo.motivo},
+            headers={"Retry-After": str(rechazo.retry_after)}
+        )
+
+    inicio = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        control_admision.liberar(clase, cliente, time.perf_counter() - inicio)
+
+# ==============================================
+# REGISTRO Y REPRODUCCIÓN DE CONSULTAS
+# ==============================================
+
+# Solo las consultas de datos; eventos, métricas, ingesta y recargas no se registran
+RUTAS_REGISTRABLES = ('/api/moleculas/', '/api/suplementos/')
+# Vistas que se precalientan al arrancar
+RUTAS_PRECALENTABLES = ('/stats', '/charts')
+
+def normalizar_consulta(path: str, params: List[tuple]) -> Dict[str, Any]:
+    """Ruta + parámetros agrupados y ordenados: dos consultas equivalentes quedan iguales"""
+    agrupados: Dict[str, List[str]] = {}
+    for nombre, valor in params:
+        agrupados.setdefault(nombre, []).append(valor)
+    return {"path": path, "params": {nombre: sorted(agrupados[nombre]) for nombre in sorted(agrupados)}}
+
+def clave_registro(consulta: Dict[str, Any]) -> str:
+    return json.dumps([consulta["path"], consulta["params"]], ensure_ascii=False)
+
+class RegistroConsultas:
+    """Acumula consultas normalizadas en memoria y las agrega al log JSONL en segundo plano"""
+
+    def __init__(self, ruta: str, muestreo: float, max_pendientes: int = 10000):
+        self.ruta = ruta
+        self.muestreo = muestreo
+        self.max_pendientes = max_pendientes
+        self.pendientes: List[str] = []
+        self.metricas = {'recorded': 0, 'written': 0, 'dropped': 0}
+
+    def registrar(self, request: Request, status: int, duracion_ms: float):
+        if self.muestreo < 1 and secrets.randbelow(10_000) >= self.muestreo * 10_000:
+            return
+        if len(self.pendientes) >= self.max_pendientes:
+            self.metricas['dropped'] += 1
+            return
+        consulta = normalizar_consulta(request.url.path, request.query_params.multi_items())
+        consulta.update({
+            "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "status": status,
+            "ms": round(duracion_ms, 2)
+        })
+        self.pendientes.append(json.dumps(consulta, ensure_ascii=False))
+        self.metricas['recorded'] += 1
+
+    def _escribir(self, lineas: List[str]):
+        with open(self.ruta, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lineas) + '\n')
+
+    async def volcar(self):
+        if not self.pendientes:
+            return
+        lineas, self.pendientes = self.pendientes, []
+        try:
+            await run_in_threadpool(self._escribir, lineas)
+            self.metricas['written'] += len(lineas)
+        except OSError as e:
+            self.metricas['dropped'] += len(lineas)
+            logger.error(f"❌ No se pudo escribir el log de consultas {self.ruta}: {e}")
+
+    async def volcar_periodicamente(self):
+        while True:
+            await asyncio.sleep(QUERY_LOG_FLUSH_SECONDS)
+            await self.volcar()
+
+    def estado(self) -> Dict[str, Any]:
+        return {"path": self.ruta, "pending": len(self.pendientes), **self.metricas}
+
+registro_consultas = RegistroConsultas(QUERY_LOG_PATH, QUERY_LOG_SAMPLE) if QUERY_LOG_PATH else None
+
+if registro_consultas:
+    @app.middleware("http")
+    async def registro_consultas_middleware(request: Request, call_next):
+        """Registrar las consultas de datos (las reproducidas se marcan y no se vuelven a registrar)"""
+        inicio = time.perf_counter()
+        response = await call_next(request)
+        if (request.method == "GET" and request.url.path.startswith(RUTAS_REGISTRABLES)
+                and not request.scope.get("state", {}).get("replay")):
+            registro_consultas.registrar(request, response.status_code, (time.perf_counter() - inicio) * 1000)
+        return response
+
+def leer_log_consultas(ruta: str) -> List[Dict[str, Any]]:
+    """Consultas de un log JSONL (las líneas mal formadas se ignoran)"""
+    consultas = []
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            try:
+                consulta = json.loads(linea)
+            except ValueError:
+                continue
+            if isinstance(consulta, dict) and isinstance(consulta.get("path"), str):
+                consultas.append({"path": consulta["path"], "params": consulta.get("params") or {}})
+    return consultas
+
+async def consulta_en_proceso(consulta: Dict[str, Any], cliente: str = "replay") -> tuple:
+    """Ejecutar un GET contra la propia app ASGI, sin red; devuelve (status, bytes)"""
+    query = urlencode([(nombre, valor) for nombre, valores in consulta["params"].items() for valor in valores])
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "root_path": "",
+        "path": consulta["path"], "raw_path": consulta["path"].encode(),
+        "query_string": query.encode(),
+        "headers": [(b"host", b"replay"), (b"accept-encoding", b"gzip")],
+        "client": ("127.0.0.1", 0), "server": ("replay", 80),
+        # Identidad propia ante el control de admisión y marca para no volver a registrarla
+        "state": {"cliente": cliente, "replay": True},
+    }
+    resultado = {"status": 0, "bytes": 0}
+    terminada = asyncio.Event()
+    pedido_enviado = False
+
+    async def receive():
+        nonlocal pedido_enviado
+        if not pedido_enviado:
+            pedido_enviado = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await terminada.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(mensaje):
+        if mensaje["type"] == "http.response.start":
+            resultado["status"] = mensaje["status"]
+        elif mensaje["type"] == "http.response.body":
+            resultado["bytes"] += len(mensaje.get("body", b""))
+            if not mensaje.get("more_body", False):
+                terminada.set()
+
+    await app(scope, receive, send)
+    return resultado["status"], resultado["bytes"]
+
+async def reproducir_consultas(consultas: List[Dict[str, Any]], concurrencia: int) -> Dict[str, Any]:
+    """Reproducir consultas en proceso con N trabajadores; informa throughput y latencias"""
+    siguiente = iter(enumerate(consultas))
+    latencias = np.zeros(len(consultas))
+    estados: Counter = Counter()
+    por_ruta: Dict[str, List[float]] = {}
+    total_bytes = 0
+
+    async def trabajador(numero: int):
+        nonlocal total_bytes
+        for i, consulta in siguiente:
+            inicio = time.perf_counter()
+            status, n_bytes = await consulta_en_proceso(consulta, f"replay-{numero}")
+            latencias[i] = (time.perf_counter() - inicio) * 1000
+            estados[status] += 1
+            total_bytes += n_bytes
+            por_ruta.setdefault(consulta["path"], []).append(latencias[i])
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador(n) for n in range(max(1, concurrencia))))
+    duracion = time.perf_counter() - inicio
+
+    def resumen(valores) -> Dict[str, float]:
+        if len(valores) == 0:
+            return {}
+        p50, p90, p99 = np.percentile(valores, [50, 90, 99])
+        return {"p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2),
+                "max_ms": round(float(np.max(valores)), 2)}
+
+    return {
+        "requests": len(consultas),
+        "concurrency": concurrencia,
+        "elapsed_s": round(duracion, 3),
+        "throughput_rps": round(len(consultas) / duracion, 1) if duracion > 0 else None,
+        "bytes": total_bytes,
+        "status": {str(k): v for k, v in sorted(estados.items())},
+        "latency": resumen(latencias),
+        "by_route": {ruta: {"requests": len(v), **resumen(v)} for ruta, v in sorted(por_ruta.items())}
+    }
+
+estado_precalentamiento: Dict[str, Any] = {}
+
+async def precalentar_cache(ruta_log: str, cantidad: int):
+    """Reproducir las consultas de estadísticas y gráficos más frecuentes del log"""
+    if not os.path.exists(ruta_log):
+        logger.info(f"🔥 Sin log de consultas en {ruta_log}: se omite el precalentamiento")
+        return
+    try:
+        consultas = await run_in_threadpool(leer_log_consultas, ruta_log)
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo leer el log de consultas {ruta_log}: {e}")
+        return
+
+    frecuencias = Counter(clave_registro(c) for c in consultas if c["path"].endswith(RUTAS_PRECALENTABLES))
+    frecuentes = [json.loads(clave) for clave, _ in frecuencias.most_common(cantidad)]
+    seleccion = [{"path": path, "params": params} for path, params in frecuentes]
+    reporte = await reproducir_consultas(seleccion, WARMUP_CONCURRENCY)
+    estado_precalentamiento.clear()
+    estado_precalentamiento.update({"log_entries": len(consultas), **reporte})
+    logger.info(
+        f"🔥 Cache precalentada: {len(seleccion)} consultas distintas de {len(consultas)} registradas "
+        f"en {reporte['elapsed_s']}s"
+    )
+
+# ==============================================
+# APIs DE MOLÉCULAS
+# ==============================================
+
+def calcular_moleculas_stats(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """Estadísticas básicas de moléculas para un estado de filtros"""
+    motor = obtener_motor('moleculas')
+
+    # Calcular rango de años
+    min_year = None
+    max_year = None
+    if 'Switch Year' in motor.columnas:
+        yy_min, yy_max = motor.min_max('Switch Year')
+        if yy_min is not None:
+            min_year = int(yy_min)
+            max_year = int(yy_max)
+    
+    return {
+        "total_records": motor.contar(filtros),
+        "unique_countries": motor.contar_distintos(filtros, 'Country'),
+        "unique_molecules": motor.contar_distintos(filtros, 'Molecule'),
+        "available_molecules": motor.valores_distintos('Molecule'),
+        "available_countries": motor.valores_distintos('Country'),
+        "date_range": {"min_year": min_year, "max_year": max_year}
+    }
+
+@app.get("/api/moleculas/stats")
+async def get_moleculas_stats(
+    request: Request,
+    molecule: Optional[str] = Query(None, description="Filtrar por molécula específica"),
+    countries: Optional[List[str]] = Query(None, description="Lista de países a incluir"),
+    year_from: Optional[float] = Query(None, description="Switch Year mínimo (inclusive)"),
+    year_to: Optional[float] = Query(None, description="Switch Year máximo (inclusive)"),
+    dose_unit: Optional[str] = Query(None, description="Unidad de dosis normalizada (mg, mg/ml, IU, %...)"),
+    dose_from: Optional[float] = Query(None, description="Dosis mínima en dose_unit (inclusive)"),
+    dose_to: Optional[float] = Query(None, description="Dosis máxima en dose_unit (inclusive)")
+):
+    """Obtener estadísticas básicas de moléculas"""
+    filtros = filtros_moleculas(molecule, countries, year_from, year_to, dose_unit, dose_from, dose_to)
+    return await respuesta_cacheada(request, 'moleculas', 'stats', filtros, calcular_moleculas_stats)
+
+@app.get("/api/moleculas/facets")
+async def get_moleculas_facets(
+    request: Request,
+    molecule: Optional[str] = Query(None, description="Filtrar por molécula específica"),
+    countries: Optional[List[str]] = Query(None, description="Lista de países a incluir"),
+    year_from: Optional[float] = Query(None, description="Switch Year mínimo (inclusive)"),
+    year_to: Optional[float] = Query(None, description="Switch Year máximo (inclusive)"),
+    dose_unit: Optional[str] = Query(None, description="Unidad de dosis normalizada (mg, mg/ml, IU, %...)"),
+    dose_from: Optional[float] = Query(None, description="Dosis mínima en dose_unit (inclusive)"),
+    dose_to: Optional[float] = Query(None, description="Dosis máxima en dose_unit (inclusive)")
+):
+    """Conteos por valor de cada filtro (molécula, países) según la selección actual"""
+    filtros = filtros_moleculas(molecule, countries, year_from, year_to, dose_unit, dose_from, dose_to)
+    return await respuesta_cacheada(request, 'moleculas', 'facets', filtros, calcular_facetas, 'moleculas')
+
+def calcular_moleculas_data(filtros: Dict[str, Any], limit: int, offset: int,
+                    campos: Optional[List[str]] = None, codificacion: str = "records") -> Dict[str, Any]:
+    """Página de datos de moléculas (JSON-safe) para un estado de filtros"""
+    motor = obtener_motor('moleculas')
+    total_records = motor.contar(filtros)
+    paginated_df = motor.pagina(filtros, limit, offset, campos)
+    return serializar_pagina(paginated_df, total_records, limit, offset, codificacion)
+
+@app.get("/api/moleculas/data")
+async def get_moleculas_data(
+    request: Request,
+    molecule: Optional[str] = Query(None),
+    countries: Optional[List[str]] = Query(None),
+    year_from: Optional[float] = Query(None, description="Switch Year mínimo (inclusive)"),
+    year_to: Optional[float] = Query(None, description="Switch Year máximo (inclusive)"),
+    dose_unit: Optional[str] = Query(None, description="Unidad de dosis normalizada (mg, mg/ml, IU, %...)"),
+    dose_from: Optional[float] = Query(None, description="Dosis mínima en dose_unit (inclusive)"),
+    dose_to: Optional[float] = Query(None, description="Dosis máxima en dose_unit (inclusive)"),
+    limit: int = Query(50, ge=1, le=1000, description="Número máximo de registros"),
+    offset: int = Query(0, ge=0, description="Offset para paginación"),
+    fields: Optional[List[str]] = Query(None, description="Columnas a devolver (repetido o separado por comas)"),
+    encoding: str = Query("records", pattern="^(records|dictionary)$", description="records o dictionary")
+):
+    """Obtener datos de moléculas con paginación"""
+    filtros = filtros_moleculas(molecule, countries, year_from, year_to, dose_unit, dose_from, dose_to)
+    campos = resolver_campos(fields, obtener_motor('moleculas').columnas) or columnas_por_defecto('moleculas')
+    return await respuesta_cacheada(
+        request, 'moleculas', 'data', filtros, calcular_moleculas_data, limit, offset, campos, encoding
+    )
+
+def calcular_moleculas_charts(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """Gráficos del dashboard de moléculas para un estado de filtros"""
+    motor = obtener_motor('moleculas')
+    hay_datos = motor.contar(filtros) > 0
+    
+    charts = {}
+    
+    try:
+        # Gráfico 1: Moléculas únicas por país
+        if {'Country', 'Molecule'}.issubset(motor.columnas) and hay_datos:
+            country_molecules = (
+                motor.distintos_por_grupo(filtros, 'Country', 'Molecule')
+                .sort_values(ascending=False)
+                .head(15)
+            )
+            if not country_molecules.empty:
+                fig_bar = px.bar(
+                    x=country_molecules.index,
+                    y=country_molecules.values,
+                    title="Número de moléculas únicas por país",
+                    labels={'x': 'País', 'y': 'Número de moléculas'},
+                    color=country_molecules.values,
+                    color_continuous_scale="viridis"
+                )
+                fig_bar.update_layout(
+                    xaxis_tickangle=-45, 
+                    height=400,
+                    showlegend=False,
+                    margin=dict(l=40, r=40, t=60, b=100),
+                    xaxis_title="País",
+                    yaxis_title="Número de moléculas"
+                )
+                charts['molecules_by_country'] = json.loads(json.dumps(fig_bar, cls=plotly.utils.PlotlyJSONEncoder))
+        
+        # Gráfico 2: Distribución RX vs OTC
+        if 'RX-OTC - Molecule' in motor.columnas and hay_datos:
+            rx_otc_counts = motor.conteo_por_valor(
+                filtros, 'RX-OTC - Molecule', excluir=['', 'nan', 'None', 'NaN']
+            )
+            if not rx_otc_counts.empty:
+                fig_pie = px.pie(
+                    values=rx_otc_counts.values,
+                    names=rx_otc_counts.index,
+                    title="Distribución por tipo de regulación (RX-OTC)"
+                )
+                fig_pie.update_layout(height=400)
+                charts['rx_otc_distribution'] = json.loads(json.dumps(fig_pie, cls=plotly.utils.PlotlyJSONEncoder))
+        
+        # Gráfico 3: Timeline de switches
+        if 'Switch Year' in motor.columnas and hay_datos:
+            yr_counts = motor.conteo_por_valor(con_rango(filtros, 'Switch Year', 1990, 2030), 'Switch Year')
+            
+            if not yr_counts.empty:
+                year_counts = pd.DataFrame({
+                    'Switch Year': yr_counts.index,
+                    'count': yr_counts.values
+                }).sort_values('Switch Year')
+                
+                if not year_counts.empty:
+                    fig_timeline = px.line(
+                        year_counts, 
+                        x='Switch Year', 
+                        y='count',
+                        title="Evolución de switches por año",
+                        markers=True
+                    )
+                    fig_timeline.update_layout(height=400)
+                    charts['switches_timeline'] = json.loads(json.dumps(fig_timeline, cls=plotly.utils.PlotlyJSONEncoder))
+        
+        # Gráfico 4: Top moléculas
+        if 'Molecule' in motor.columnas and hay_datos:
+            top_molecules = motor.conteo_por_valor(filtros, 'Molecule').head(10)
+            if not top_molecules.empty:
+                fig_top = px.bar(
+                    x=top_molecules.values,
+                    y=top_molecules.index,
+                    orientation='h',
+                    title="Top 10 moléculas más frecuentes",
+                    labels={'x': 'Número de registros', 'y': 'Molécula'}
+                )
+                fig_top.update_layout(
+                    height=400, 
+                    yaxis={'categoryorder': 'total ascending'},
+                    margin=dict(l=150, r=40, t=60, b=40)
+                )
+                charts['top_molecules'] = json.loads(json.dumps(fig_top, cls=plotly.utils.PlotlyJSONEncoder))
+
+        # Gráfico 5: Distribución de dosis en la unidad más frecuente (o la filtrada)
+        if 'dose_unit' in motor.columnas and hay_datos:
+            unidades = motor.conteo_por_valor(filtros, 'dose_unit')
+            if not unidades.empty:
+                unidad = unidades.index[0]
+                dosis = motor.conteo_por_valor(con_igualdad(filtros, 'dose_unit', [unidad]), 'dose_amount').sort_index()
+                if not dosis.empty:
+                    fig_dose = px.bar(
+                        x=[f"{v:g}" for v in dosis.index],
+                        y=dosis.values,
+                        title=f"Distribución de dosis ({unidad})",
+                        labels={'x': f'Dosis ({unidad})', 'y': 'Número de registros'}
+                    )
+                    fig_dose.update_layout(height=400, xaxis_type='category')
+                    charts['dose_distribution'] = json.loads(json.dumps(fig_dose, cls=plotly.utils.PlotlyJSONEncoder))
+        
+    except Exception as e:
+        logger.error(f"Error generando gráficos de moléculas: {e}")
+        raise HTTPException(status_code=500, detail=f"Error generando gráficos: {str(e)}")
+    
+    return charts
+
+@app.get("/api/moleculas/charts")
+async def get_moleculas_charts(
+    request: Request,
+    molecule: Optional[str] = Query(None),
+    countries: Optional[List[str]] = Query(None),
+    year_from: Optional[float] = Query(None, description="Switch Year mínimo (inclusive)"),
+    year_to: Optional[float] = Query(None, description="Switch Year máximo (inclusive)"),
+    dose_unit: Optional[str] = Query(None, description="Unidad de dosis normalizada (mg, mg/ml, IU, %...)"),
+    dose_from: Optional[float] = Query(None, description="Dosis mínima en dose_unit (inclusive)"),
+    dose_to: Optional[float] = Query(None, description="Dosis máxima en dose_unit (inclusive)")
+):
+    """Generar gráficos para el dashboard de moléculas"""
+    filtros = filtros_moleculas(molecule, countries, year_from, year_to, dose_unit, dose_from, dose_to)
+    return await respuesta_cacheada(request, 'moleculas', 'charts', filtros, calcular_moleculas_charts)
+
+# ==============================================
+# APIs DE SUPLEMENTOS
+# ==============================================
+
+def calcular_suplementos_stats(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """Estadísticas básicas de suplementos para un estado de filtros"""
+    motor = obtener_motor('suplementos')
+    total_records = motor.contar(filtros)
+    
+    return {
+        "total_records": total_records,
+        "unique_countries": motor.contar_distintos(filtros, 'pais'),
+        "unique_ingredients": motor.contar_distintos(filtros, 'ingrediente'),
+        "unique_types": motor.contar_distintos(filtros, 'tipo'),
+        "available_ingredients": motor.valores_distintos('ingrediente'),
+        "available_countries": motor.valores_distintos('pais'),
+        "available_types": motor.valores_distintos('tipo'),
+        "established_percentage": (motor.sumar(filtros, 'establecido') / total_records * 100) if total_records > 0 else 0
+    }
+
+@app.get("/api/suplementos/stats")
+async def get_suplementos_stats(
+    request: Request,
+    ingredient: Optional[str] = Query(None, description="Filtrar por ingrediente específico"),
+    countries: Optional[List[str]] = Query(None, description="Lista de países a incluir"),
+    ingredient_type: Optional[str] = Query(None, description="Filtrar por tipo de ingrediente"),
+    minimo_from: Optional[float] = Query(None, description="Valor mínimo de 'minimo' (inclusive)"),
+    minimo_to: Optional[float] = Query(None, description="Valor máximo de 'minimo' (inclusive)"),
+    maximo_from: Optional[float] = Query(None, description="Valor mínimo de 'maximo' (inclusive)"),
+    maximo_to: Optional[float] = Query(None, description="Valor máximo de 'maximo' (inclusive)")
+):
+    """Obtener estadísticas básicas de suplementos"""
+    filtros = filtros_suplementos(
+        ingredient, countries, ingredient_type, minimo_from, minimo_to, maximo_from, maximo_to
+    )
+    return await respuesta_cacheada(request, 'suplementos', 'stats', filtros, calcular_suplementos_stats)
+
+@app.get("/api/suplementos/facets")
+async def get_suplementos_facets(
+    request: Request,
+    ingredient: Optional[str] = Query(None, description="Filtrar por ingrediente específico"),
+    countries: Optional[List[str]] = Query(None, description="Lista de países a incluir"),
+    ingredient_type: Optional[str] = Query(None, description="Filtrar por tipo de ingrediente"),
+    minimo_from: Optional[float] = Query(None, description="Valor mínimo de 'minimo' (inclusive)"),
+    minimo_to: Optional[float] = Query(None, description="Valor máximo de 'minimo' (inclusive)"),
+    maximo_from: Optional[float] = Query(None, description="Valor mínimo de 'maximo' (inclusive)"),
+    maximo_to: Optional[float] = Query(None, description="Valor máximo de 'maximo' (inclusive)")
+):
+    """Conteos por valor de cada filtro (ingrediente, países, tipo) según la selección actual"""
+    filtros = filtros_suplementos(
+        ingredient, countries, ingredient_type, minimo_from, minimo_to, maximo_from, maximo_to
+    )
+    return await respuesta_cacheada(request, 'suplementos', 'facets', filtros, calcular_facetas, 'suplementos')
+
+def calcular_suplementos_data(filtros: Dict[str, Any], limit: int, offset: int,
+                    campos: Optional[List[str]] = None, codificacion: str = "records") -> Dict[str, Any]:
+    """Página de datos de suplementos (JSON-safe) para un estado de filtros"""
+    motor = obtener_motor('suplementos')
+    total_records = motor.contar(filtros)
+    paginated_df = motor.pagina(filtros, limit, offset, campos)
+    return serializar_pagina(paginated_df, total_records, limit, offset, codificacion)
+
+@app.get("/api/suplementos/data")
+async def get_suplementos_data(
+    request: Request,
+    ingredient: Optional[str] = Query(None),
+    countries: Optional[List[str]] = Query(None),
+    ingredient_type: Optional[str] = Query(None),
+    minimo_from: Optional[float] = Query(None, description="Valor mínimo de 'minimo' (inclusive)"),
+    minimo_to: Optional[float] = Query(None, description="Valor máximo de 'minimo' (inclusive)"),
+    maximo_from: Optional[float] = Query(None, description="Valor mínimo de 'maximo' (inclusive)"),
+    maximo_to: Optional[float] = Query(None, description="Valor máximo de 'maximo' (inclusive)"),
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    fields: Optional[List[str]] = Query(None, description="Columnas a devolver (repetido o separado por comas)"),
+    encoding: str = Query("records", pattern="^(records|dictionary)$", description="records o dictionary")
+):
+    """Obtener datos de suplementos con paginación"""
+    filtros = filtros_suplementos(
+        ingredient, countries, ingredient_type, minimo_from, minimo_to, maximo_from, maximo_to
+    )
+    campos = resolver_campos(fields, obtener_motor('suplementos').columnas) or columnas_por_defecto('suplementos')
+    return await respuesta_cacheada(
+        request, 'suplementos', 'data', filtros, calcular_suplementos_data, limit, offset, campos, encoding
+    )
+
+def calcular_suplementos_charts(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """Gráficos del dashboard de suplementos para un estado de filtros"""
+    motor = obtener_motor('suplementos')
+    hay_datos = motor.contar(filtros) > 0
+    
+    charts = {}
+    
+    try:
+        # Gráfico 1: Ingredientes por país
+        if hay_datos:
+            country_ingredients = (
+                motor.distintos_por_grupo(filtros, 'pais', 'ingrediente')
+                .sort_values(ascending=False)
+                .head(15)
+            )
+            if not country_ingredients.empty:
+                fig_bar = px.bar(
+                    x=country_ingredients.index,
+                    y=country_ingredients.values,
+                    title="Número de ingredientes únicos por país",
                     labels={'x': 'País', 'y': 'Número de ingredientes'},
                     color=country_ingredients.values,
                     color_continuous_scale="viridis"
@@ -678,8 +2590,8 @@ async def get_suplementos_charts(
                 charts['ingredients_by_country'] = json.loads(json.dumps(fig_bar, cls=plotly.utils.PlotlyJSONEncoder))
         
         # Gráfico 2: Distribución por tipo
-        if not filtered_df.empty:
-            type_counts = filtered_df['tipo'].value_counts()
+        if hay_datos:
+            type_counts = motor.conteo_por_valor(filtros, 'tipo')
             if not type_counts.empty:
                 fig_pie = px.pie(
                     values=type_counts.values,
@@ -690,8 +2602,8 @@ async def get_suplementos_charts(
                 charts['type_distribution'] = json.loads(json.dumps(fig_pie, cls=plotly.utils.PlotlyJSONEncoder))
         
         # Gráfico 3: Estado de regulación
-        if not filtered_df.empty:
-            regulation_counts = filtered_df['categoria_regulacion'].value_counts()
+        if hay_datos:
+            regulation_counts = motor.conteo_por_valor(filtros, 'categoria_regulacion')
             if not regulation_counts.empty:
                 fig_regulation = px.bar(
                     x=regulation_counts.index,
@@ -704,8 +2616,8 @@ async def get_suplementos_charts(
                 charts['regulation_status'] = json.loads(json.dumps(fig_regulation, cls=plotly.utils.PlotlyJSONEncoder))
         
         # Gráfico 4: Top ingredientes
-        if not filtered_df.empty:
-            top_ingredients = filtered_df['ingrediente'].value_counts().head(10)
+        if hay_datos:
+            top_ingredients = motor.conteo_por_valor(filtros, 'ingrediente').head(10)
             if not top_ingredients.empty:
                 fig_top = px.bar(
                     x=top_ingredients.values,
@@ -723,6 +2635,23 @@ async def get_suplementos_charts(
     
     return charts
 
+@app.get("/api/suplementos/charts")
+async def get_suplementos_charts(
+    request: Request,
+    ingredient: Optional[str] = Query(None),
+    countries: Optional[List[str]] = Query(None),
+    ingredient_type: Optional[str] = Query(None),
+    minimo_from: Optional[float] = Query(None, description="Valor mínimo de 'minimo' (inclusive)"),
+    minimo_to: Optional[float] = Query(None, description="Valor máximo de 'minimo' (inclusive)"),
+    maximo_from: Optional[float] = Query(None, description="Valor mínimo de 'maximo' (inclusive)"),
+    maximo_to: Optional[float] = Query(None, description="Valor máximo de 'maximo' (inclusive)")
+):
+    """Generar gráficos para el dashboard de suplementos"""
+    filtros = filtros_suplementos(
+        ingredient, countries, ingredient_type, minimo_from, minimo_to, maximo_from, maximo_to
+    )
+    return await respuesta_cacheada(request, 'suplementos', 'charts', filtros, calcular_suplementos_charts)
+
 @app.get("/api/suplementos/comparison")
 async def get_regulatory_comparison(
     countries: Optional[List[str]] = Query(None, description="Países a comparar"),
@@ -736,7 +2665,8 @@ async def get_regulatory_comparison(
         
         # Filtrar por países si se especifican
         if countries:
-            filtered_data = {k: v for k, v in data.items() if k in countries}
+            buscados = {normalizar_pais(c) for c in countries}
+            filtered_data = {k: v for k, v in data.items() if normalizar_pais(k) in buscados}
         else:
             filtered_data = data
         
@@ -849,6 +2779,817 @@ async def get_regulatory_stats():
         logger.error(f"Error obteniendo estadísticas: {e}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
 
+# ==============================================
+# PERFILES POR PAÍS
+# ==============================================
+
+# Nombre canónico (el 'pais' en español de suplementos) -> (código ISO, otros nombres en las fuentes)
+PAISES = {
+    'Argentina': ('AR', []),
+    'Bolivia': ('BO', []),
+    'Brasil': ('BR', ['Brazil']),
+    'Chile': ('CL', []),
+    'Colombia': ('CO', []),
+    'Costa Rica': ('CR', []),
+    'Cuba': ('CU', []),
+    'Ecuador': ('EC', []),
+    'El Salvador': ('SV', []),
+    'Guatemala': ('GT', []),
+    'Honduras': ('HN', []),
+    'México': ('MX', ['Mexico']),
+    'Nicaragua': ('NI', []),
+    'Panamá': ('PA', ['Panama']),
+    'Paraguay': ('PY', []),
+    'Perú': ('PE', ['Peru']),
+    'República Dominicana': ('DO', ['Dominican Republic']),
+    'Uruguay': ('UY', []),
+    'Venezuela': ('VE', []),
+    'Estados Unidos': ('US', ['United States', 'United States of America', 'USA', 'EE.UU.', 'EEUU']),
+    'Canadá': ('CA', ['Canada']),
+    'Alemania': ('DE', ['Germany']),
+    'España': ('ES', ['Spain']),
+    'Francia': ('FR', ['France']),
+    'Italia': ('IT', ['Italy']),
+    'Reino Unido': ('GB', ['United Kingdom', 'UK']),
+    'Japón': ('JP', ['Japan']),
+    'China': ('CN', []),
+    'Australia': ('AU', []),
+    'Unión Europea': ('EU', ['European Union', 'UE']),
+}
+
+def clave_pais(nombre: Any) -> str:
+    """Forma comparable de un nombre de país: sin tildes, en minúsculas y con espacios simples"""
+    texto = unicodedata.normalize('NFKD', str(nombre))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.casefold().split())
+
+# Clave comparable (nombre, alias o código ISO) -> nombre canónico
+ALIAS_PAISES = {
+    clave_pais(alias): canonico
+    for canonico, (codigo, alias_pais) in PAISES.items()
+    for alias in [canonico, codigo, *alias_pais]
+}
+
+def normalizar_pais(nombre: Any) -> str:
+    """Nombre canónico de un país; los que no están en la tabla se devuelven sin espacios sobrantes"""
+    return ALIAS_PAISES.get(clave_pais(nombre), ' '.join(str(nombre).split()))
+
+def normalizar_paises(serie: pd.Series) -> pd.Series:
+    """normalizar_pais vectorizado: se resuelve una vez cada valor distinto"""
+    codigos, unicos = pd.factorize(serie)
+    canonicos = np.array([normalizar_pais(v) for v in unicos], dtype=object)
+    return pd.Series(canonicos[codigos], index=serie.index).where(codigos >= 0)
+
+def traducir_paises(nombre: str, paises: List[str]) -> List[str]:
+    """Valores de país tal como aparecen en un dataset para los nombres pedidos (en cualquier idioma).
+
+    Un nombre sin equivalente en el dataset se deja tal cual, así el filtro se comporta como antes.
+    """
+    nombres = data_cache.get('perfiles_pais', {}).get('nombres', {}).get(nombre, {})
+    traducidos = []
+    for pais in paises:
+        traducidos.extend(nombres.get(normalizar_pais(pais), [pais]))
+    return list(dict.fromkeys(traducidos))
+
+def _nombres_originales(canonicos: pd.Series, originales: pd.Series) -> Dict[str, List[str]]:
+    """Nombre canónico -> valores originales del dataset que lo representan"""
+    pares = pd.DataFrame({'canonico': canonicos, 'original': originales}).dropna().drop_duplicates()
+    return {c: sorted(grupo['original'].astype(str)) for c, grupo in pares.groupby('canonico', sort=False)}
+
+def _entero(valor) -> Optional[int]:
+    return None if pd.isna(valor) else int(valor)
+
+def _perfiles_moleculas(df: pd.DataFrame, paises: pd.Series) -> Dict[str, Dict[str, Any]]:
+    """Switches por país: registros, moléculas distintas, rango de años y distribución RX/OTC"""
+    grupos = df.assign(_pais=paises).dropna(subset=['_pais']).groupby('_pais', sort=False)
+    resumen = grupos.agg(
+        registros=('Molecule', 'size'),
+        moleculas=('Molecule', 'nunique'),
+        primer_switch=('Switch Year', 'min'),
+        ultimo_switch=('Switch Year', 'max'),
+    )
+    rx_otc = grupos['RX-OTC - Molecule'].value_counts() if 'RX-OTC - Molecule' in df.columns else pd.Series(dtype=int)
+    moleculas = grupos['Molecule'].unique()
+    return {
+        pais: {
+            "total_records": int(fila.registros),
+            "unique_molecules": int(fila.moleculas),
+            "first_switch_year": _entero(fila.primer_switch),
+            "last_switch_year": _entero(fila.ultimo_switch),
+            "rx_otc": {
+                str(k): int(v) for k, v in rx_otc.get(pais, pd.Series(dtype=int)).items()
+                if str(k) not in ('', 'nan', 'None', 'NaN')
+            },
+            "molecules": sorted(str(m) for m in moleculas[pais]),
+        }
+        for pais, fila in resumen.iterrows()
+    }
+
+def _cobertura(ingredientes: int, total_ingredientes: int) -> float:
+    return round(ingredientes / total_ingredientes, 4) if total_ingredientes else 0.0
+
+def _perfiles_suplementos(df: pd.DataFrame, paises: pd.Series, total_ingredientes: int) -> Dict[str, Dict[str, Any]]:
+    """Cobertura de ingredientes por país (sobre el total de ingredientes distintos) y sus límites"""
+    grupos = df.assign(_pais=paises).dropna(subset=['_pais']).groupby('_pais', sort=False)
+    columnas_limites = [c for c in ['ingrediente', 'tipo', 'minimo', 'maximo', 'unidad', 'establecido'] if c in df.columns]
+    perfiles = {}
+    for pais, grupo in grupos:
+        limites = grupo[columnas_limites].sort_values('ingrediente')
+        if 'establecido' in limites:
+            # Tras una ingesta con valores faltantes la columna deja de ser bool (object o float)
+            limites = limites.assign(establecido=limites['establecido'].map(lambda v: None if pd.isna(v) else bool(v)))
+        ingredientes = grupo['ingrediente'].nunique()
+        perfiles[pais] = {
+            "total_records": len(grupo),
+            "unique_ingredients": int(ingredientes),
+            "coverage": _cobertura(ingredientes, total_ingredientes),
+            "by_type": {str(k): int(v) for k, v in grupo['tipo'].value_counts().items()} if 'tipo' in grupo else {},
+            "established": int(grupo['establecido'].eq(True).sum()) if 'establecido' in grupo else None,
+            "limits": make_json_safe(limites).to_dict(orient='records'),
+        }
+    return perfiles
+
+def _perfil_regulatorio(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Resumen del marco regulatorio de un país: valores clave, sin el texto completo de cada sección"""
+    secciones = info.get("sections", {})
+    tiempo = secciones.get("tiempo_aprobacion", {})
+    return {
+        "country_code": info.get("country_code"),
+        "last_updated": info.get("last_updated"),
+        "category": secciones.get("categoria_regulatoria", {}).get("value"),
+        "registration_type": secciones.get("proceso_registro", {}).get("value"),
+        "approval_time": {"legal": tiempo.get("legal_time"), "industry": tiempo.get("industry_time")},
+        "health_claims_permitted": secciones.get("propiedades_salud", {}).get("permitted"),
+        "sections": list(secciones),
+    }
+
+# Dataset -> (columna de país, sección del perfil)
+FUENTES_PERFIL = {'moleculas': ('Country', 'molecules'), 'suplementos': ('pais', 'supplements')}
+
+def _parciales_dataset(nombre: str, completo: pd.DataFrame, filas: pd.DataFrame, paises: pd.Series) -> Dict[str, Dict[str, Any]]:
+    """Sección del perfil de un dataset para los países de filas (paises: nombre canónico por fila)"""
+    if nombre == 'suplementos':
+        return _perfiles_suplementos(filas, paises, completo['ingrediente'].nunique())
+    return _perfiles_moleculas(filas, paises)
+
+def _componer_perfiles(nombres: Dict[str, Dict[str, List[str]]], parciales: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Unir las secciones parciales en el perfil de cada país (ordenados por nombre)"""
+    todos = sorted(set().union(*(p.keys() for p in parciales.values())), key=clave_pais)
+    perfiles = {
+        pais: {
+            "country": pais,
+            "country_code": PAISES.get(pais, (None,))[0],
+            "source_names": {fuente: n[pais] for fuente, n in nombres.items() if pais in n},
+            **{seccion: datos.get(pais) for seccion, datos in parciales.items()},
+        }
+        for pais in todos
+    }
+    sin_tabla = [p for p in todos if p not in PAISES]
+    if sin_tabla:
+        logger.warning(f"⚠️ Países sin entrada en la tabla de normalización: {sin_tabla}")
+    return {'perfiles': perfiles, 'nombres': nombres, 'parciales': parciales}
+
+def construir_perfiles_pais() -> Dict[str, Any]:
+    """Materializar el perfil de cada país cruzando moléculas, suplementos y marco regulatorio.
+
+    Se construye completo al cargar o recargar los datos; cada delta de ingesta solo recalcula
+    los países que toca (actualizar_perfiles_pais). Las consultas de /api/countries/profile
+    son búsquedas en un diccionario.
+    """
+    nombres = {}
+    parciales = {}
+
+    for nombre, (columna, seccion) in FUENTES_PERFIL.items():
+        df = data_cache.get(DATASETS[nombre]['cache_key'])
+        if df is not None and not df.empty and columna in df.columns:
+            paises = normalizar_paises(df[columna])
+            nombres[nombre] = _nombres_originales(paises, df[columna])
+            parciales[seccion] = _parciales_dataset(nombre, df, df, paises)
+
+    regulatorios = regulatory_data.get("regulatory_data", {})
+    nombres['regulatory'] = {}
+    parciales['regulatory'] = {}
+    for pais, info in regulatorios.items():
+        canonico = normalizar_pais(pais)
+        nombres['regulatory'].setdefault(canonico, []).append(pais)
+        parciales['regulatory'][canonico] = _perfil_regulatorio(info)
+
+    materializados = _componer_perfiles(nombres, parciales)
+    logger.info(f"🌎 Perfiles por país materializados: {len(materializados['perfiles'])}")
+    return materializados
+
+def actualizar_perfiles_pais(nombre: str, df: pd.DataFrame, cambios: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    """Recalcular solo los países afectados por un delta de ingesta y combinarlos con los vigentes.
+
+    df es el dataset ya con el delta aplicado; devuelve una estructura nueva (la vigente no se
+    modifica, así las lecturas concurrentes nunca ven un perfil a medias).
+    """
+    vigentes = data_cache.get('perfiles_pais')
+    if vigentes is None or nombre not in FUENTES_PERFIL:
+        return vigentes
+    columna, seccion = FUENTES_PERFIL[nombre]
+    nombres = dict(vigentes['nombres'])
+    parciales = dict(vigentes['parciales'])
+    nombres_dataset = dict(nombres.get(nombre, {}))
+    parcial = dict(parciales.get(seccion, {}))
+
+    tocadas = pd.concat([c[columna] for c in cambios.values() if columna in c.columns])
+    afectados = set(normalizar_paises(tocadas).dropna())
+    if not afectados and nombre != 'suplementos':
+        return vigentes
+
+    # Filas del dataset nuevo de los países afectados (con cualquiera de sus grafías)
+    originales = set(tocadas.dropna()).union(*(nombres_dataset.get(p, []) for p in afectados))
+    filas = df[df[columna].isin(originales)] if columna in df.columns else df.iloc[0:0]
+    paises = normalizar_paises(filas[columna]) if not filas.empty else pd.Series(dtype=object)
+    recalculados = _parciales_dataset(nombre, df, filas, paises) if not filas.empty else {}
+    for pais in afectados:
+        parcial.pop(pais, None)
+        nombres_dataset.pop(pais, None)
+    parcial.update(recalculados)
+    if not filas.empty:
+        nombres_dataset.update(_nombres_originales(paises, filas[columna]))
+
+    if nombre == 'suplementos':
+        # La cobertura es relativa al total de ingredientes, que el delta puede haber cambiado
+        total = df['ingrediente'].nunique()
+        parcial = {
+            pais: {**datos, "coverage": _cobertura(datos["unique_ingredients"], total)}
+            for pais, datos in parcial.items()
+        }
+
+    nombres[nombre] = nombres_dataset
+    parciales[seccion] = parcial
+    return _componer_perfiles(nombres, parciales)
+
+@app.get("/api/countries/profile")
+async def get_country_profiles(
+    countries: Optional[List[str]] = Query(None, description="Países (nombre en español o inglés, o código ISO); todos si se omite")
+):
+    """Perfil por país: switches de moléculas, cobertura y límites de suplementos y marco regulatorio"""
+    materializados = data_cache.get('perfiles_pais')
+    if materializados is None:
+        raise HTTPException(status_code=503, detail="Perfiles por país no disponibles todavía")
+    perfiles = materializados['perfiles']
+
+    if countries:
+        pedidos = list(dict.fromkeys(c.strip() for valor in countries for c in valor.split(',') if c.strip()))
+        canonicos = {pedido: normalizar_pais(pedido) for pedido in pedidos}
+        datos = {c: perfiles[c] for c in dict.fromkeys(canonicos.values()) if c in perfiles}
+        no_encontrados = [pedido for pedido, c in canonicos.items() if c not in perfiles]
+    else:
+        datos, no_encontrados = perfiles, []
+
+    return {
+        "data_version": data_cache.get('version'),
+        "total_countries": len(datos),
+        "data": datos,
+        "not_found": no_encontrados,
+    }
+
+# ==============================================
+# INGESTA INCREMENTAL
+# ==============================================
+
+class DeltaIngesta(BaseModel):
+    """Cambios a nivel de fila: cada upsert reemplaza la fila completa con su clave natural"""
+    upserts: List[Dict[str, Any]] = []
+    deletes: List[Dict[str, Any]] = []
+
+# Serializa deltas y recargas completas
+lock_datos = asyncio.Lock()
+
+def _texto_clave(serie: pd.Series) -> pd.Series:
+    # 2005 y 2005.0 deben producir la misma clave
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float).astype(str)
+    return serie.astype(str)
+
+def claves_texto(df: pd.DataFrame, columnas: List[str]) -> pd.Index:
+    """Clave natural de cada fila como texto, para búsquedas vectorizadas con get_indexer"""
+    texto = _texto_clave(df[columnas[0]])
+    for col in columnas[1:]:
+        texto = texto + "\x1f" + _texto_clave(df[col])
+    return pd.Index(texto.to_numpy())
+
+def indice_claves(nombre: str) -> pd.Index:
+    """Índice de claves naturales del dataset (se construye una vez y se mantiene con cada delta)"""
+    claves = data_cache.setdefault('claves', {})
+    if nombre not in claves:
+        df = data_cache[DATASETS[nombre]['cache_key']]
+        claves[nombre] = claves_texto(df, DATASETS[nombre]['clave'])
+    return claves[nombre]
+
+def _posiciones_de(claves: pd.Index, buscadas: pd.Index) -> np.ndarray:
+    """Posición de cada clave buscada (-1 si no existe); con claves repetidas gana la primera"""
+    if claves.is_unique:
+        return claves.get_indexer(buscadas)
+    primeras = ~claves.duplicated(keep='first')
+    encontradas = claves[primeras].get_indexer(buscadas)
+    return np.where(encontradas >= 0, np.flatnonzero(primeras)[encontradas], -1)
+
+# Marcadores de valor faltante en columnas numéricas o de fecha (no son errores de conversión)
+VALORES_FALTANTES = ['', '-', '—', 'nan', 'NaN', 'None']
+VALORES_BOOLEANOS = {'true': True, '1': True, '1.0': True, 'false': False, '0': False, '0.0': False}
+_INVALIDO = object()
+
+def _booleano_estricto(valor):
+    """True/False, None si falta, o _INVALIDO ("no", "x"... no se interpretan)"""
+    if isinstance(valor, (bool, np.bool_)):
+        return bool(valor)
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    texto = str(valor).strip()
+    if texto in VALORES_FALTANTES:
+        return None
+    return VALORES_BOOLEANOS.get(texto.lower(), _INVALIDO)
+
+def _preparar_filas(nombre: str, filas: List[Dict[str, Any]], df: pd.DataFrame, columnas: List[str]) -> pd.DataFrame:
+    """Validar filas entrantes y llevarlas a las columnas y tipos del dataset"""
+    recibidas = pd.DataFrame(filas)
+    desconocidas = [c for c in recibidas.columns if c not in df.columns]
+    if desconocidas:
+        raise ValueError(f"Columnas desconocidas para {nombre}: {desconocidas}")
+    faltantes = [c for c in DATASETS[nombre]['clave'] if c not in recibidas.columns]
+    if faltantes and not recibidas.empty:
+        raise ValueError(f"Faltan columnas de la clave natural: {faltantes}")
+
+    crudas = recibidas.reindex(columns=columnas)
+    invalidas = {}
+    for col in columnas:
+        # Listas u objetos en una columna escalar se guardarían como su texto
+        no_escalares = crudas[col].map(lambda v: isinstance(v, (list, dict, tuple, set)))
+        if no_escalares.any():
+            invalidas[col] = [json.dumps(v, default=str) for v in crudas.loc[no_escalares, col].head(5)]
+    if invalidas:
+        detalle = "; ".join(f"{col}: {valores}" for col, valores in invalidas.items())
+        raise ValueError(f"Valores no escalares para {nombre}: {detalle}")
+
+    recibidas = DATASETS[nombre]['normalizar'](crudas.copy())
+    booleanas = DATASETS[nombre]['booleanas']
+    for col in columnas:
+        destino = df[col].dtype
+        convertida = None
+        if col in booleanas:
+            valores = crudas[col].map(_booleano_estricto)
+            fallidas = valores.map(lambda v: v is _INVALIDO)
+            if fallidas.any():
+                invalidas[col] = list(dict.fromkeys(crudas.loc[fallidas, col].tolist()))[:5]
+                continue
+            recibidas[col] = valores.astype(bool) if valores.notna().all() else valores.astype(object)
+            continue
+        if is_datetime64_any_dtype(destino):
+            convertida = recibidas[col] = pd.to_datetime(recibidas[col], errors='coerce')
+        elif pd.api.types.is_float_dtype(destino):
+            convertida = recibidas[col] = pd.to_numeric(recibidas[col], errors='coerce').astype(destino)
+        elif pd.api.types.is_integer_dtype(destino):
+            convertida = pd.to_numeric(recibidas[col], errors='coerce')
+        if pd.api.types.is_integer_dtype(destino) and recibidas[col].notna().all():
+            try:
+                recibidas[col] = recibidas[col].astype(destino)
+            except (ValueError, TypeError):
+                pass
+        if convertida is not None:
+            # Un valor dado (no vacío ni '-') que no se pudo convertir es un error, no un faltante
+            dado = crudas[col].notna() & ~crudas[col].astype(str).str.strip().isin(VALORES_FALTANTES)
+            fallidas = dado & convertida.isna()
+            if fallidas.any():
+                invalidas[col] = list(dict.fromkeys(crudas.loc[fallidas, col].tolist()))[:5]
+    if invalidas:
+        detalle = "; ".join(f"{col}: {valores}" for col, valores in invalidas.items())
+        raise ValueError(f"Valores no convertibles para {nombre}: {detalle}")
+    return recibidas
+
+def preparar_delta(nombre: str, upserts: List[Dict[str, Any]], deletes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resolver un delta contra el dataset actual: borrados primero, luego upserts por clave natural"""
+    spec = DATASETS[nombre]
+    df = data_cache.get(spec['cache_key'])
+    if df is None or df.empty:
+        raise HTTPException(status_code=500, detail=spec['mensaje_error'])
+    clave = spec['clave']
+    claves = indice_claves(nombre)
+
+    # Borrados: todas las filas con la clave indicada (posiciones en el DataFrame actual)
+    a_borrar = _preparar_filas(nombre, deletes, df, clave) if deletes else pd.DataFrame(columns=clave)
+    claves_borrar = claves_texto(a_borrar, clave) if len(a_borrar) else pd.Index([])
+    borradas = np.flatnonzero(claves.isin(claves_borrar))
+    conservar = np.ones(len(df), dtype=bool)
+    conservar[borradas] = False
+    base = df.iloc[conservar].copy()
+    claves_base = claves.delete(borradas)
+
+    # Upserts: si la clave ya existe se reemplaza (su primera aparición) en su lugar, si no se agrega al final
+    nuevas = _preparar_filas(nombre, upserts, df, list(df.columns)) if upserts else df.iloc[0:0].copy()
+    claves_nuevas = claves_texto(nuevas, clave) if len(nuevas) else pd.Index([])
+    unicas = ~claves_nuevas.duplicated(keep='last')
+    nuevas, claves_nuevas = nuevas[unicas], claves_nuevas[unicas]
+    posiciones = _posiciones_de(claves_base, claves_nuevas) if len(nuevas) else np.empty(0, dtype=np.intp)
+    existentes = posiciones >= 0
+
+    orden = np.argsort(posiciones[existentes])
+    actualizadas = posiciones[existentes][orden]
+    filas_actualizadas = nuevas[existentes].iloc[orden]
+    filas_reemplazadas = base.iloc[actualizadas]
+
+    agregadas = nuevas[~existentes].copy()
+    inicio = (int(df.index.max()) + 1) if pd.api.types.is_integer_dtype(df.index) and len(df) else len(df)
+    agregadas.index = pd.RangeIndex(inicio, inicio + len(agregadas))
+
+    # Un solo concat (que resuelve los dtypes) y una permutación que devuelve cada fila a su lugar
+    reemplazo = filas_actualizadas.set_axis(base.index[actualizadas])
+    sin_cambios = np.ones(len(base), dtype=bool)
+    sin_cambios[actualizadas] = False
+    partes = [p for p in (base.iloc[sin_cambios], reemplazo, agregadas) if len(p)]
+    df_nuevo = pd.concat(partes) if len(partes) > 1 else base
+    if len(partes) > 1:
+        destino = np.concatenate([np.flatnonzero(sin_cambios), actualizadas, np.arange(len(base), len(df_nuevo))])
+        permutacion = np.empty(len(df_nuevo), dtype=np.intp)
+        permutacion[destino] = np.arange(len(df_nuevo))
+        df_nuevo = df_nuevo.iloc[permutacion]
+    return {
+        'clave': clave,
+        'df': df_nuevo,
+        'claves': claves_base.append(claves_nuevas[~existentes]),
+        'borradas': borradas,
+        'actualizadas': actualizadas,
+        'n_agregadas': len(agregadas),
+        'cambiadas': np.concatenate([actualizadas, np.arange(len(base), len(df_nuevo))]).astype(np.intp),
+        'filas_borradas': df.iloc[borradas],
+        'filas_reemplazadas': filas_reemplazadas,
+        'filas_actualizadas': filas_actualizadas,
+        'filas_nuevas': agregadas,
+        'no_encontradas': int((~claves_borrar.isin(claves)).sum()),
+    }
+
+async def ingerir_delta(nombre: str, upserts: List[Dict[str, Any]], deletes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aplicar un delta a los datos, índices, motor y cache sin recargar los archivos fuente"""
+    if nombre not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"Dataset desconocido: {nombre}")
+
+    async with lock_datos:
+        inicio = time.perf_counter()
+        try:
+            delta = await run_in_threadpool(preparar_delta, nombre, upserts, deletes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        motor = await run_in_threadpool(obtener_motor(nombre).con_delta, delta)
+
+        cambios = await run_in_threadpool(cambios_de_delta, nombre, delta)
+        perfiles = await run_in_threadpool(actualizar_perfiles_pais, nombre, delta['df'], cambios)
+
+        # Publicar el nuevo estado de una sola vez
+        data_cache[DATASETS[nombre]['cache_key']] = delta['df']
+        data_cache['claves'][nombre] = delta['claves']
+        data_cache['motores'][nombre] = motor
+        data_cache['perfiles_pais'] = perfiles
+        version = registrar_cambios("ingest", {nombre: cambios})
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+
+    resultado = {
+        "dataset": nombre,
+        "deleted": len(delta['borradas']),
+        "not_found": delta['no_encontradas'],
+        "updated": len(delta['actualizadas']),
+        "inserted": delta['n_agregadas'],
+        "total_records": len(delta['df']),
+        "data_version": version,
+        "elapsed_ms": round(duracion_ms, 2)
+    }
+    logger.info(f"📥 Delta aplicado: {resultado}")
+    return resultado
+
+def verificar_token_ingesta(request: Request):
+    """Autenticación de la ingesta: 'Authorization: Bearer <INGEST_TOKEN>' o cabecera X-Ingest-Token"""
+    if not INGEST_TOKEN:
+        raise HTTPException(status_code=503, detail="Ingesta deshabilitada: defina INGEST_TOKEN")
+    autorizacion = request.headers.get("authorization", "")
+    if autorizacion.lower().startswith("bearer "):
+        token = autorizacion[7:].strip()
+    else:
+        token = request.headers.get("x-ingest-token", "")
+    if not secrets.compare_digest(token.encode(), INGEST_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de ingesta inválido")
+
+@app.post("/api/ingest/{dataset}", dependencies=[Depends(verificar_token_ingesta)])
+async def ingest_delta(dataset: str, delta: DeltaIngesta):
+    """Aplicar upserts y borrados a nivel de fila (dataset: moleculas o suplementos)"""
+    return await ingerir_delta(dataset, delta.upserts, delta.deletes)
+
+def leer_json(ruta: Path) -> Any:
+    return json.loads(ruta.read_text(encoding='utf-8'))
+
+async def vigilar_carpeta_ingesta(carpeta: Path):
+    """Aplicar los deltas JSON que aparezcan en la carpeta de ingesta.
+
+    Cada archivo contiene {"dataset": ..., "upserts": [...], "deletes": [...]}; se mueve a
+    procesados/ o errores/ al terminar. Escribirlo con otra extensión y renombrarlo a .json
+    evita leer archivos a medio copiar.
+    """
+    procesados, errores = carpeta / "procesados", carpeta / "errores"
+    logger.info(f"📂 Vigilando carpeta de ingesta: {carpeta}")
+    while True:
+        for archivo in await run_in_threadpool(lambda: sorted(carpeta.glob("*.json"))):
+            destino = procesados
+            try:
+                contenido = await run_in_threadpool(leer_json, archivo)
+                await ingerir_delta(contenido["dataset"], contenido.get("upserts", []), contenido.get("deletes", []))
+            except Exception as e:
+                logger.error(f"❌ Error aplicando {archivo.name}: {getattr(e, 'detail', e)}")
+                destino = errores
+            destino.mkdir(exist_ok=True)
+            archivo.replace(destino / archivo.name)
+        await asyncio.sleep(INGEST_POLL_SECONDS)
+
+# ==============================================
+# VERSIONES DE DATOS Y CHANGELOG
+# ==============================================
+
+def hashes_filas(df: pd.DataFrame) -> np.ndarray:
+    """Hash de contenido por fila (vectorizado)"""
+    if df.empty or len(df.columns) == 0:
+        return np.zeros(len(df), dtype=np.uint64)
+    # Sobre object: el hash no cambia si un delta cambia el dtype de la columna (p. ej. bool -> object)
+    return pd.util.hash_pandas_object(df.astype(object), index=False).to_numpy()
+
+def hashes_regulatorios(datos: Dict[str, Any]) -> Dict[str, str]:
+    """Hash por sección de regulatory_data.json, con claves 'País/sección'"""
+    hashes = {}
+    for pais, info in datos.get("regulatory_data", {}).items():
+        secciones = info.get("sections", {})
+        generales = {k: v for k, v in info.items() if k != "sections"}
+        for clave, contenido in [(pais, generales), *((f"{pais}/{s}", c) for s, c in secciones.items())]:
+            texto = json.dumps(contenido, sort_keys=True, ensure_ascii=False, default=str)
+            hashes[clave] = hashlib.blake2b(texto.encode('utf-8'), digest_size=8).hexdigest()
+    return hashes
+
+def _claves_ocurrencia(claves: pd.Index) -> pd.Index:
+    """Desambiguar claves repetidas agregando su número de aparición"""
+    if claves.is_unique:
+        return claves
+    serie = pd.Series(claves.to_numpy(), dtype=object)
+    ocurrencia = serie.groupby(serie).cumcount()
+    return pd.Index((serie + "\x1e" + ocurrencia.astype(str)).to_numpy())
+
+def diferencias(claves_previas: pd.Index, hashes_previos: np.ndarray,
+                claves_nuevas: pd.Index, hashes_nuevos: np.ndarray) -> Dict[str, np.ndarray]:
+    """Posiciones agregadas/borradas/cambiadas entre dos snapshots (búsquedas hash, tiempo lineal)"""
+    previas = pd.Series(hashes_previos, index=_claves_ocurrencia(claves_previas))
+    nuevas = pd.Series(hashes_nuevos, index=_claves_ocurrencia(claves_nuevas))
+    presentes = nuevas.index.isin(previas.index)
+    comunes = np.flatnonzero(presentes)
+    posiciones_previas = previas.index.get_indexer(nuevas.index[comunes])
+    distintas = hashes_previos[posiciones_previas] != hashes_nuevos[comunes]
+    return {
+        'agregadas': np.flatnonzero(~presentes),
+        'borradas': np.flatnonzero(~previas.index.isin(nuevas.index)),
+        'cambiadas_nuevas': comunes[distintas],
+        'cambiadas_previas': posiciones_previas[distintas],
+    }
+
+def _snapshot_dataset(nombre: str) -> Dict[str, Any]:
+    df = data_cache.get(DATASETS[nombre]['cache_key'])
+    if df is None or df.empty or not set(DATASETS[nombre]['clave']).issubset(df.columns):
+        return {'df': pd.DataFrame(), 'claves': pd.Index([]), 'hashes': np.zeros(0, dtype=np.uint64)}
+    return {'df': df, 'claves': indice_claves(nombre), 'hashes': hashes_filas(df)}
+
+def registrar_snapshot(origen: str):
+    """Hashear el snapshot recién cargado, compararlo con el anterior y registrar lo que cambió"""
+    previo = data_cache.get('snapshot')
+    actual = {nombre: _snapshot_dataset(nombre) for nombre in DATASETS}
+    actual['regulatory'] = hashes_regulatorios(regulatory_data)
+    data_cache['snapshot'] = actual
+
+    if previo is None:
+        registrar_cambios(origen, {})
+        return
+
+    cambios = {}
+    for nombre in DATASETS:
+        antes, ahora = previo[nombre], actual[nombre]
+        if list(antes['df'].columns) != list(ahora['df'].columns):
+            # Cambió el esquema: todo el dataset se considera reemplazado
+            diff = {'agregadas': np.arange(len(ahora['df'])), 'borradas': np.arange(len(antes['df'])),
+                    'cambiadas_nuevas': np.empty(0, dtype=np.intp), 'cambiadas_previas': np.empty(0, dtype=np.intp)}
+        else:
+            diff = diferencias(antes['claves'], antes['hashes'], ahora['claves'], ahora['hashes'])
+        cambios[nombre] = {
+            'agregadas': ahora['df'].iloc[diff['agregadas']],
+            'borradas': antes['df'].iloc[diff['borradas']],
+            'cambiadas_previas': antes['df'].iloc[diff['cambiadas_previas']],
+            'cambiadas_nuevas': ahora['df'].iloc[diff['cambiadas_nuevas']],
+        }
+
+    antes, ahora = previo['regulatory'], actual['regulatory']
+    cambios['regulatory'] = {
+        'agregadas': sorted(set(ahora) - set(antes)),
+        'borradas': sorted(set(antes) - set(ahora)),
+        'cambiadas': sorted(k for k in ahora.keys() & antes.keys() if ahora[k] != antes[k]),
+    }
+    registrar_cambios(origen, cambios)
+
+def cambios_de_delta(nombre: str, delta: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+    """Cambios de un delta ya resuelto; actualiza los hashes del snapshot sin recalcular todo"""
+    snapshot = data_cache['snapshot'][nombre]
+    hashes = np.concatenate([
+        np.delete(snapshot['hashes'], delta['borradas']),
+        np.zeros(delta['n_agregadas'], dtype=np.uint64)
+    ])
+    previos = hashes[delta['actualizadas']]
+    hashes[delta['cambiadas']] = hashes_filas(delta['df'].iloc[delta['cambiadas']])
+    # Un upsert idéntico a la fila existente no cuenta como cambio
+    distintas = previos != hashes[delta['actualizadas']]
+
+    data_cache['snapshot'][nombre] = {'df': delta['df'], 'claves': delta['claves'], 'hashes': hashes}
+    return {
+        'agregadas': delta['filas_nuevas'],
+        'borradas': delta['filas_borradas'],
+        'cambiadas_previas': delta['filas_reemplazadas'][distintas],
+        'cambiadas_nuevas': delta['filas_actualizadas'][distintas],
+    }
+
+def _describir_claves(filas: pd.DataFrame, clave: List[str]) -> List[Dict[str, Any]]:
+    return make_json_safe(filas[clave].head(CHANGELOG_MAX_KEYS)).to_dict("records")
+
+def registrar_cambios(origen: str, cambios: Dict[str, Dict[str, Any]]) -> int:
+    """Invalidar la cache afectada y agregar una entrada al changelog si hubo cambios; devuelve la versión vigente"""
+    changelog = data_cache.setdefault('changelog', [])
+    resumen = {}
+    for nombre, c in cambios.items():
+        if nombre == 'regulatory':
+            if any(c.values()):
+                resumen[nombre] = {
+                    "added": len(c['agregadas']), "removed": len(c['borradas']), "changed": len(c['cambiadas']),
+                    "keys": {"added": c['agregadas'], "removed": c['borradas'], "changed": c['cambiadas']}
+                }
+            continue
+        afectadas = pd.concat([c['agregadas'], c['borradas'], c['cambiadas_previas'], c['cambiadas_nuevas']])
+        if afectadas.empty:
+            continue
+        cache_resultados.invalidar_por_filas(nombre, afectadas)
+        clave = DATASETS[nombre]['clave']
+        resumen[nombre] = {
+            "added": len(c['agregadas']), "removed": len(c['borradas']), "changed": len(c['cambiadas_nuevas']),
+            "keys": {
+                "added": _describir_claves(c['agregadas'], clave),
+                "removed": _describir_claves(c['borradas'], clave),
+                "changed": _describir_claves(c['cambiadas_nuevas'], clave),
+            }
+        }
+
+    version = data_cache.get('version', 0)
+    if resumen or not changelog:
+        version += 1
+        data_cache['version'] = version
+        entrada = {
+            "version": version,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "source": origen,
+            "datasets": resumen
+        }
+        changelog.append(entrada)
+        del changelog[:-CHANGELOG_SIZE]
+        canal_versiones.publicar(entrada)
+        logger.info(f"🏷️ Versión de datos {version} ({origen}): {', '.join(resumen) or 'carga inicial'}")
+    return version
+
+@app.get("/api/changelog")
+async def get_changelog(
+    request: Request,
+    since: int = Query(0, ge=0, description="Última versión conocida por el cliente")
+):
+    """Cambios posteriores a una versión de datos (ETag por versión para sondeos baratos)"""
+    version = data_cache.get('version', 0)
+    etag = f'"v{version}-s{since}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    changelog = data_cache.get('changelog', [])
+    payload = {
+        "version": version,
+        "since": since,
+        # El historial no alcanza: el cliente debe descartar todo lo que tenga en cache
+        "truncated": bool(changelog) and since < changelog[0]["version"] - 1,
+        "changes": [entrada for entrada in changelog if entrada["version"] > since]
+    }
+    return JSONResponse(content=payload, headers={"ETag": etag})
+
+# ==============================================
+# EVENTOS DE VERSIÓN (SSE)
+# ==============================================
+
+class CanalVersiones:
+    """Difusión de los cambios de versión a los dashboards abiertos.
+
+    Cada conexión es una cola corta en el event loop: una conexión inactiva solo cuesta
+    el latido periódico. Si un cliente no consume, se descartan sus eventos más viejos;
+    los ids de evento le permiten completar el historial al reconectar.
+    """
+
+    def __init__(self, max_clientes: int, tamano_cola: int = 16):
+        self.max_clientes = max_clientes
+        self.tamano_cola = tamano_cola
+        self.suscriptores: set = set()
+        self.metricas = {'published': 0, 'dropped': 0, 'rejected': 0, 'connections_total': 0}
+
+    def suscribir(self) -> Optional[asyncio.Queue]:
+        if len(self.suscriptores) >= self.max_clientes:
+            self.metricas['rejected'] += 1
+            return None
+        cola = asyncio.Queue(maxsize=self.tamano_cola)
+        self.suscriptores.add(cola)
+        self.metricas['connections_total'] += 1
+        return cola
+
+    def desuscribir(self, cola: asyncio.Queue):
+        self.suscriptores.discard(cola)
+
+    def publicar(self, entrada: Dict[str, Any]):
+        evento = resumen_evento(entrada)
+        for cola in self.suscriptores:
+            if cola.full():
+                cola.get_nowait()
+                self.metricas['dropped'] += 1
+            cola.put_nowait(evento)
+        self.metricas['published'] += 1
+
+    def estado(self) -> Dict[str, Any]:
+        return {"connections": len(self.suscriptores), **self.metricas}
+
+canal_versiones = CanalVersiones(SSE_MAX_CLIENTS)
+
+def resumen_evento(entrada: Dict[str, Any]) -> Dict[str, Any]:
+    """Entrada del changelog sin el detalle de claves: alcanza para saber qué paneles recargar"""
+    return {
+        "version": entrada["version"],
+        "timestamp": entrada["timestamp"],
+        "source": entrada["source"],
+        "datasets": {
+            nombre: {k: v for k, v in detalle.items() if k != "keys"}
+            for nombre, detalle in entrada["datasets"].items()
+        }
+    }
+
+def formato_sse(evento: str, datos: Dict[str, Any], id_evento: Optional[int] = None) -> str:
+    id_evento = datos['version'] if id_evento is None else id_evento
+    return f"id: {id_evento}\nevent: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+@app.get("/api/events")
+async def stream_events(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0, description="Última versión conocida por el cliente")
+):
+    """Canal Server-Sent Events con los cambios de versión de datos (qué datasets cambiaron)"""
+    # EventSource reenvía el último id recibido al reconectar
+    ultimo_id = request.headers.get("last-event-id", "")
+    desde = int(ultimo_id) if ultimo_id.isdigit() else since
+
+    cola = canal_versiones.suscribir()
+    if cola is None:
+        return JSONResponse(
+            status_code=503,
+            content={"message": "Demasiadas conexiones de eventos abiertas"},
+            headers={"Retry-After": "30"}
+        )
+
+    async def generar():
+        try:
+            version = data_cache.get('version', 0)
+            pendiente = desde is not None and desde < version
+            yield "retry: 5000\n\n"
+            # El id no avanza hasta enviar lo pendiente, por si se corta antes
+            yield formato_sse("hello", {"version": version}, desde if pendiente else version)
+
+            # Ponerse al día con lo ocurrido mientras el cliente estaba desconectado
+            enviada = version
+            if pendiente:
+                changelog = data_cache.get('changelog', [])
+                if not changelog or desde < changelog[0]["version"] - 1:
+                    yield formato_sse("version", {"version": version, "truncated": True, "datasets": {}})
+                else:
+                    for entrada in changelog:
+                        if entrada["version"] > desde:
+                            yield formato_sse("version", resumen_evento(entrada))
+
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                    continue
+                if evento["version"] <= enviada:
+                    continue
+                enviada = evento["version"]
+                yield formato_sse("version", evento)
+        finally:
+            canal_versiones.desuscribir(cola)
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ==============================================
 # ENDPOINTS DE SALUD Y UTILIDADES
 # ==============================================
@@ -865,12 +3606,26 @@ async def health_check():
         }
     }
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Métricas de cache de resultados, coalescencia de peticiones y control de admisión"""
+    return {
+        "result_cache": cache_resultados.estado(),
+        "single_flight": single_flight.estado(),
+        "admission": control_admision.estado(),
+        "events": canal_versiones.estado(),
+        "query_log": registro_consultas.estado() if registro_consultas else None,
+        "warmup": estado_precalentamiento or None,
+        "compression": estado_compresion()
+    }
+
 @app.get("/api/reload-data")
 async def reload_data():
     """Recargar datos manualmente (útil para desarrollo)"""
     try:
-        await load_data_on_startup()
-        return {"message": "Datos recargados exitosamente"}
+        async with lock_datos:
+            await load_data_on_startup()
+        return {"message": "Datos recargados exitosamente", "data_version": data_cache.get('version')}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error recargando datos: {str(e)}")
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Reproducción de un log de consultas del Portal ILAR (modo local)
+- Carga main:app en el mismo proceso, con su ciclo de vida completo
+- Reproduce el log JSONL grabado con QUERY_LOG_PATH a la concurrencia indicada
+- Informa throughput, latencias y códigos de estado
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reproducir un log de consultas contra la app en proceso")
+    parser.add_argument("log", nargs="?", default=os.environ.get("QUERY_LOG_PATH", "query_log.jsonl"),
+                        help="Log JSONL de consultas (por defecto QUERY_LOG_PATH o query_log.jsonl)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Trabajadores concurrentes")
+    parser.add_argument("-n", "--limit", type=int, default=None, help="Reproducir solo las primeras N consultas")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Repetir el log N veces")
+    parser.add_argument("--json", action="store_true", help="Imprimir el reporte completo en JSON")
+    return parser.parse_args()
+
+async def run(args):
+    # Importar después de ajustar el entorno: main lee la configuración al importarse
+    import main
+
+    consultas = main.leer_log_consultas(args.log)[:args.limit] * args.repeat
+    if not consultas:
+        print(f"⚠️ No hay consultas para reproducir en {args.log}")
+        return 1
+
+    async with main.lifespan(main.app):
+        reporte = await main.reproducir_consultas(consultas, args.concurrency)
+
+    if args.json:
+        print(json.dumps(reporte, indent=2, ensure_ascii=False))
+        return 0
+
+    latencia = reporte["latency"]
+    print(f"🔁 {reporte['requests']} consultas, concurrencia {reporte['concurrency']}, {reporte['elapsed_s']}s")
+    print(f"⚡ {reporte['throughput_rps']} req/s, {reporte['bytes'] / 1024:.1f} KB")
+    print(f"⏱️ p50 {latencia['p50_ms']} ms | p90 {latencia['p90_ms']} ms | "
+          f"p99 {latencia['p99_ms']} ms | max {latencia['max_ms']} ms")
+    print(f"📊 Estados: {reporte['status']}")
+    for ruta, datos in reporte["by_route"].items():
+        print(f"   {ruta:<40} {datos['requests']:>6}  p50 {datos['p50_ms']:>8} ms  p99 {datos['p99_ms']:>8} ms")
+    return 0
+
+def main():
+    args = parse_args()
+    # El log que se reproduce no debe crecer ni usarse para precalentar la cache
+    os.environ.pop("QUERY_LOG_PATH", None)
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
@@ -380,6 +380,50 @@ function updateDashboardStatus(dashboard, status) {
     }
 }
 
+// ==============================================
+// ACTUALIZACIONES DE DATOS EN VIVO
+// ==============================================
+// Escucha /api/events y llama a onChange con los datasets que cambiaron
+// (agrupando eventos cercanos), para recargar solo los paneles afectados
+function subscribeDataVersions(onChange, delay = 500) {
+    if (!window.EventSource) return null;
+
+    const source = new EventSource('/api/events');
+    let currentVersion = null;
+    let pending = {};
+    let timer = null;
+
+    function schedule(datasets, truncated) {
+        Object.keys(datasets).forEach(name => { pending[name] = true; });
+        if (truncated) pending.all = true;
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            const changed = pending;
+            pending = {};
+            onChange(changed);
+        }, delay);
+    }
+
+    source.addEventListener('hello', function(e) {
+        const { version } = JSON.parse(e.data);
+        // Versión menor: el servidor se reinició y los datos pueden ser otros
+        if (currentVersion !== null && version < currentVersion) {
+            schedule({}, true);
+        }
+        currentVersion = version;
+    });
+
+    source.addEventListener('version', function(e) {
+        const event = JSON.parse(e.data);
+        currentVersion = event.version;
+        schedule(event.datasets, event.truncated);
+    });
+
+    return source;
+}
+
+window.subscribeDataVersions = subscribeDataVersions;
+
 // ==============================================
 // ATAJOS DE TECLADO
 // ==============================================
@@ -54,6 +54,9 @@ const SupplementsDashboard = {
             
             this.updateLoadingStep('¡Listo!');
             
+            // Escuchar cambios de datos del servidor
+            this.realtime.start();
+            
             // Ocultar loading screen
             setTimeout(() => {
                 this.hideInitialLoading();
@@ -698,6 +701,95 @@ const SupplementsDashboard = {
         }
     },
 
+    /**
+     * Módulo de actualizaciones en vivo (Server-Sent Events)
+     */
+    realtime: {
+        source: null,
+        version: null,
+        pending: {},
+        timer: null,
+
+        /**
+         * Abrir el canal de eventos de versión de datos
+         */
+        start() {
+            if (this.source || !window.EventSource) return;
+
+            this.source = new EventSource('/api/events');
+
+            this.source.addEventListener('hello', (e) => {
+                const { version } = JSON.parse(e.data);
+                // Versión menor: el servidor se reinició y los datos pueden ser otros
+                if (this.version !== null && version < this.version) {
+                    this.schedule({ suplementos: true, regulatory: true });
+                }
+                this.version = version;
+            });
+
+            this.source.addEventListener('version', (e) => {
+                const event = JSON.parse(e.data);
+                this.version = event.version;
+                this.schedule(event.truncated ? { suplementos: true, regulatory: true } : event.datasets);
+            });
+        },
+
+        /**
+         * Agrupar eventos cercanos en una sola recarga
+         */
+        schedule(datasets) {
+            Object.keys(datasets).forEach(name => { this.pending[name] = true; });
+            clearTimeout(this.timer);
+            this.timer = setTimeout(() => {
+                const changed = this.pending;
+                this.pending = {};
+                this.refresh(changed);
+            }, 500);
+        },
+
+        /**
+         * Recargar solo los paneles afectados por los datasets cambiados
+         */
+        async refresh(changed) {
+            if (!changed.suplementos && !changed.regulatory) return;
+
+            SupplementsAPI.clearCache();
+            const state = SupplementsDashboard.state;
+
+            try {
+                if (changed.suplementos) {
+                    const stats = await SupplementsAPI.getStats(state.currentFilters);
+                    state.currentData = await SupplementsAPI.getData({
+                        filters: state.currentFilters,
+                        pagination: state.currentData.pagination
+                    });
+                    SupplementsDashboard.updateStats(stats);
+                    SupplementsDashboard.table.render();
+
+                    if (state.currentSection === 'analisis') {
+                        await SupplementsDashboard.charts.loadAll();
+                    }
+
+                    const ingredientSelect = document.getElementById('ingredientAnalysisSelect');
+                    if (state.currentSection === 'ingrediente' && ingredientSelect && ingredientSelect.value) {
+                        await SupplementsDashboard.ingredient.loadAnalysis(ingredientSelect.value);
+                    }
+                }
+
+                if (changed.regulatory && state.currentSection === 'comparacion') {
+                    const select = document.getElementById('comparisonCountries');
+                    if (select && select.selectedOptions.length > 0) {
+                        await SupplementsDashboard.comparison.load();
+                    }
+                }
+
+                SupplementsComponents.notifications.info('Datos actualizados en el servidor');
+            } catch (error) {
+                console.error('Error actualizando paneles:', error);
+            }
+        }
+    },
+
     /**
      * Utilidades del dashboard
      */
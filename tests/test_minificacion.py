@@ -0,0 +1,20 @@
+"""Casos límite de la minificación de assets (ejecutar con: python -m pytest tests)"""
+
+from main import minificar_js
+
+
+def test_division_tras_incremento_no_es_regex():
+    # Si la '/' tras '++' se tomara como regex, el comentario quedaría dentro del literal
+    assert minificar_js("x = i++ / 2 // comentario\n") == "x = i++ / 2\n"
+
+
+def test_division_tras_decremento_no_es_regex():
+    assert minificar_js("y = j-- / 2 /* nota */ + k\n") == "y = j-- / 2   + k\n"
+
+
+def test_regex_tras_operador_se_conserva():
+    assert minificar_js("r = a + /\\/\\/ x/.test(s) // fin\n") == "r = a + /\\/\\/ x/.test(s)\n"
+
+
+def test_division_simple():
+    assert minificar_js("z = a / b // fin\n") == "z = a / b\n"